@@ -0,0 +1,844 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Canonical Ltd.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+#
+# Synthetic pykdump stand-in
+#
+# Serves (a subset of) pykdump.API from a synthetic memory image, so that the
+# pykdumplib walkers can be run and measured outside of a crash session. Call
+# install() before importing any other pykdumplib module.
+#
+
+import struct
+import sys
+import types
+
+# Base address of the first allocation, the memory below it is reserved (the
+# s390x lowcore lives at address 0)
+IMAGE_BASE = 0x10000
+
+PAGE_SHIFT = 12
+PAGE_SIZE = 1 << PAGE_SHIFT
+
+
+class Scalar(object):
+    '''
+    Integer type (in native byte order, like the memory and layout decoders)
+    '''
+    def __init__(self, name, fmt):
+        self.name = name
+        self.fmt = struct.Struct('=' + fmt)
+        self.size = self.fmt.size
+        self.align = self.size
+
+    def decode(self, image, addr):
+        return self.fmt.unpack(image.read(addr, self.size))[0]
+
+    def encode(self, image, addr, value):
+        image.write(addr, self.fmt.pack(value))
+
+
+class Pointer(Scalar):
+    '''
+    Pointer type. Pointers to char are decoded as strings, all others as Ptr
+    objects.
+    '''
+    def __init__(self, target):
+        Scalar.__init__(self, target + ' *', 'Q')
+        self.target = target
+
+    def decode(self, image, addr):
+        value = Scalar.decode(self, image, addr)
+        if self.target == 'char':
+            return image.read_string(value) if value else None
+        return Ptr(value, image, self.target)
+
+    def encode(self, image, addr, value):
+        Scalar.encode(self, image, addr, int(value))
+
+
+class Array(object):
+    '''
+    Array type. Char arrays are decoded as strings, all others as lists.
+    '''
+    def __init__(self, elem, count):
+        self.name = '%s[%d]' % (elem.name, count)
+        self.elem = elem
+        self.count = count
+        self.size = elem.size * count
+        self.align = elem.align
+
+    def decode(self, image, addr):
+        if self.elem.name == 'char':
+            data = image.read(addr, self.size)
+            return data.split(b'\0', 1)[0].decode()
+        return [self.elem.decode(image, addr + i * self.elem.size)
+                for i in range(self.count)]
+
+    def encode(self, image, addr, value):
+        if self.elem.name == 'char':
+            data = value.encode()[:self.size - 1]
+            image.write(addr, data.ljust(self.size, b'\0'))
+            return
+        for (i, v) in enumerate(value):
+            self.elem.encode(image, addr + i * self.elem.size, v)
+
+
+class Struct(object):
+    '''
+    Struct (or union) type
+    '''
+    def __init__(self, name, fields, union=False):
+        self.name = name
+        self.fields = {}
+        offset = 0
+        self.size = 0
+        self.align = 1
+        for (fname, ftype) in fields:
+            self.align = max(self.align, ftype.align)
+            if union:
+                offset = 0
+            else:
+                offset = (offset + ftype.align - 1) & ~(ftype.align - 1)
+            self.fields[fname] = (offset, ftype)
+            offset += ftype.size
+            self.size = max(self.size, offset)
+        self.size = (self.size + self.align - 1) & ~(self.align - 1)
+
+    def offset(self, member):
+        '''
+        Return the offset of a (dotted) member
+        '''
+        offset = 0
+        stype = self
+        for name in member.split('.'):
+            (off, stype) = stype.fields[name]
+            offset += off
+        return offset
+
+    def decode(self, image, addr):
+        return StructResult(image, self, addr)
+
+    def encode(self, image, addr, value):
+        for (name, v) in value.items():
+            (off, ftype) = self.fields[name]
+            ftype.encode(image, addr + off, v)
+
+
+class StructResult(object):
+    '''
+    A struct in the memory image
+    '''
+    def __init__(self, image, stype, addr):
+        self._image = image
+        self._type = stype
+        self._addr = addr
+
+    def __getattr__(self, name):
+        try:
+            (off, ftype) = self._type.fields[name]
+        except KeyError:
+            raise AttributeError('%s has no field %s' % (self._type.name,
+                                                         name))
+        return ftype.decode(self._image, self._addr + off)
+
+    def __add__(self, i):
+        return StructResult(self._image, self._type,
+                            self._addr + i * self._type.size)
+
+    def __sub__(self, i):
+        return self.__add__(-i)
+
+    def __int__(self):
+        return self._addr
+
+    __index__ = __int__
+
+    def __repr__(self):
+        return '<%s 0x%x>' % (self._type.name, self._addr)
+
+
+class Ptr(int):
+    '''
+    A pointer value. Attribute accesses dereference the pointer and pointer
+    arithmetic is scaled by the size of the target type.
+    '''
+    def __new__(cls, value, image, target):
+        ptr = int.__new__(cls, value)
+        ptr._image = image
+        ptr._target = target
+        return ptr
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.Deref, name)
+
+    @property
+    def Deref(self):
+        return self._image.type(self._target).decode(self._image, int(self))
+
+    def __add__(self, i):
+        size = self._image.type(self._target).size
+        return Ptr(int(self) + i * size, self._image, self._target)
+
+    def __sub__(self, i):
+        return self.__add__(-i)
+
+
+class Image(object):
+    '''
+    Synthetic (sparse) memory image with types, symbols and enumerators.
+    Objects are either allocated from IMAGE_BASE upwards or placed at fixed
+    addresses.
+    '''
+    def __init__(self, base=IMAGE_BASE):
+        self.pages = {}
+        self.brk = base
+        self.fixed_pages = set()
+        self.types = {}
+        self.symbols = {}
+        self.enums = {}
+        for (name, fmt) in (('char', 'b'), ('unsigned char', 'B'),
+                            ('short', 'h'), ('unsigned short', 'H'),
+                            ('int', 'i'), ('unsigned int', 'I'),
+                            ('long', 'q'), ('unsigned long', 'Q'),
+                            ('u64', 'Q')):
+            self.types[name] = Scalar(name, fmt)
+
+    def type(self, name):
+        '''
+        Return a type by name ('struct foo', 'foo_t', 'foo *', 'foo[8]')
+        '''
+        name = name.strip()
+        if name in self.types:
+            return self.types[name]
+        if name.endswith('*'):
+            return Pointer(name[:-1].strip())
+        if name.endswith(']'):
+            (elem, count) = name[:-1].split('[')
+            return Array(self.type(elem), int(count, 0))
+        raise TypeError('Unknown type: %s' % name)
+
+    def define(self, name, fields, union=False):
+        '''
+        Define a struct (or union) type from a list of (name, type name)
+        tuples
+        '''
+        self.types[name] = Struct(name, [(f, self.type(t))
+                                         for (f, t) in fields], union=union)
+        return self.types[name]
+
+    def alloc(self, size, align=8):
+        '''
+        Allocate (zeroed) memory and return its address
+        '''
+        addr = (self.brk + align - 1) & ~(align - 1)
+        while True:
+            fixed = [p for p in range(addr >> PAGE_SHIFT,
+                                      ((addr + size - 1) >> PAGE_SHIFT) + 1)
+                     if p in self.fixed_pages]
+            if not fixed:
+                break
+            # Skip the memory of objects placed at fixed addresses
+            addr = ((((fixed[-1] + 1) << PAGE_SHIFT) + align - 1) &
+                    ~(align - 1))
+        self.brk = addr + size
+        return addr
+
+    def reserve(self, addr, size):
+        '''
+        Reserve memory at a fixed address (so that it isn't allocated)
+        '''
+        for p in range(addr >> PAGE_SHIFT,
+                       ((addr + size - 1) >> PAGE_SHIFT) + 1):
+            self.fixed_pages.add(p)
+        return addr
+
+    def read(self, addr, size):
+        '''
+        Read memory, unwritten memory reads as zeroes
+        '''
+        offset = addr & (PAGE_SIZE - 1)
+        if offset + size <= PAGE_SIZE:
+            page = self.pages.get(addr >> PAGE_SHIFT)
+            if page is None:
+                return bytes(size)
+            return bytes(page[offset:offset + size])
+
+        chunks = []
+        while size > 0:
+            n = min(size, PAGE_SIZE - offset)
+            chunks.append(self.read(addr, n))
+            addr += n
+            size -= n
+            offset = 0
+        return b''.join(chunks)
+
+    def write(self, addr, data):
+        while data:
+            offset = addr & (PAGE_SIZE - 1)
+            n = min(len(data), PAGE_SIZE - offset)
+            page = self.pages.get(addr >> PAGE_SHIFT)
+            if page is None:
+                page = self.pages[addr >> PAGE_SHIFT] = bytearray(PAGE_SIZE)
+            page[offset:offset + n] = data[:n]
+            addr += n
+            data = data[n:]
+
+    def new(self, typename, align=None, addr=None, **values):
+        '''
+        Allocate (or place at addr) and initialize an object and return its
+        address
+        '''
+        t = self.type(typename)
+        if addr is None:
+            addr = self.alloc(t.size, align or t.align)
+        else:
+            self.reserve(addr, t.size)
+        t.encode(self, addr, values)
+        return addr
+
+    def store(self, addr, typename, member, value):
+        '''
+        Store a value into a (dotted) member of the object at addr
+        '''
+        t = self.type(typename)
+        for name in member.split('.'):
+            (off, t) = t.fields[name]
+            addr += off
+        t.encode(self, addr, value)
+
+    def new_string(self, s):
+        data = s.encode() + b'\0'
+        addr = self.alloc(len(data), 1)
+        self.write(addr, data)
+        return addr
+
+    def read_string(self, addr):
+        data = b''
+        while True:
+            chunk = self.read(addr + len(data), 64)
+            end = chunk.find(b'\0')
+            if end >= 0:
+                return (data + chunk[:end]).decode()
+            data += chunk
+
+    def add_symbol(self, name, typename, addr=None, value=None):
+        '''
+        Add a symbol (allocating and initializing it unless addr is given)
+        '''
+        if addr is None:
+            addr = self.alloc(self.type(typename).size)
+        else:
+            self.reserve(addr, self.type(typename).size)
+        if value is not None:
+            self.type(typename).encode(self, addr, value)
+        self.symbols[name] = (typename, addr)
+        return addr
+
+    def read_symbol(self, name):
+        (typename, addr) = self.symbols[name]
+        return self.type(typename).decode(self, addr)
+
+
+# The current image, used by the API functions
+_image = None
+
+
+def Addr(obj):
+    if isinstance(obj, StructResult):
+        return obj._addr
+    return int(obj)
+
+
+def readSU(typename, addr):
+    return StructResult(_image, _image.type(typename), int(addr))
+
+
+def readSymbol(name):
+    return _image.read_symbol(name)
+
+
+def enumerator_value(name):
+    return _image.enums[name]
+
+
+def container_of(ptr, typename, member):
+    stype = _image.type(typename)
+    return StructResult(_image, stype, Addr(ptr) - stype.offset(member))
+
+
+def member_offset(typename, member):
+    try:
+        return _image.type(typename).offset(member)
+    except KeyError:
+        return -1
+
+
+def struct_size(typename):
+    return _image.type(typename).size
+
+
+def readmem(addr, size):
+    return _image.read(addr, size)
+
+
+def readS32(addr):
+    return _image.types['int'].decode(_image, addr)
+
+
+def readU32(addr):
+    return _image.types['unsigned int'].decode(_image, addr)
+
+
+def readU64(addr):
+    return _image.types['unsigned long'].decode(_image, addr)
+
+
+readPtr = readU64
+
+
+def readSUListFromHead(headaddr, listfieldname, mystruct, maxel=None,
+                       inchead=False):
+    stype = _image.type(mystruct)
+    offset = stype.offset(listfieldname)
+    result = []
+    addr = readPtr(headaddr)
+    while addr != headaddr and (maxel is None or len(result) < maxel):
+        result.append(StructResult(_image, stype, addr - offset))
+        addr = readPtr(addr)
+    return result
+
+
+def install(image):
+    '''
+    Install the image as the pykdump backend (sys.modules['pykdump.API'])
+    '''
+    global _image
+
+    if 'pykdump.API' in sys.modules:
+        if not getattr(sys.modules['pykdump.API'], '_fakedump', False):
+            raise RuntimeError('The real pykdump is already loaded')
+        _image = image
+        return
+    _image = image
+
+    pykdump = types.ModuleType('pykdump')
+    wrapcrash = types.ModuleType('pykdump.wrapcrash')
+    wrapcrash.StructResult = StructResult
+    api = types.ModuleType('pykdump.API')
+    api._fakedump = True
+    api.sys = sys
+    api.StructResult = StructResult
+    for func in (Addr, readSU, readSymbol, enumerator_value, container_of,
+                 member_offset, struct_size, readmem, readS32, readU32,
+                 readU64, readPtr, readSUListFromHead):
+        setattr(api, func.__name__, func)
+    pykdump.API = api
+    pykdump.wrapcrash = wrapcrash
+    sys.modules['pykdump'] = pykdump
+    sys.modules['pykdump.API'] = api
+    sys.modules['pykdump.wrapcrash'] = wrapcrash
+
+
+#
+# Generators
+#
+
+def kernel_image(ncpus=8, base=IMAGE_BASE):
+    '''
+    Return a new image with the kernel types, enumerators, cpu masks and
+    per-cpu offsets used by pykdumplib
+    '''
+    image = Image(base)
+    image.define('struct rb_node', [('__rb_parent_color', 'unsigned long'),
+                                    ('rb_right', 'struct rb_node *'),
+                                    ('rb_left', 'struct rb_node *')])
+    image.define('struct rb_root', [('rb_node', 'struct rb_node *')])
+    image.define('struct list_head', [('next', 'struct list_head *'),
+                                      ('prev', 'struct list_head *')])
+    image.define('struct hlist_head', [('first', 'struct hlist_node *')])
+    image.define('struct hlist_node', [('next', 'struct hlist_node *'),
+                                       ('pprev', 'unsigned long')])
+    image.define('struct hlist_nulls_head',
+                 [('first', 'struct hlist_nulls_node *')])
+    image.define('struct hlist_nulls_node',
+                 [('next', 'struct hlist_nulls_node *'),
+                  ('pprev', 'unsigned long')])
+    image.define('struct kernfs_elem_dir', [('subdirs', 'unsigned long'),
+                                            ('children', 'struct rb_root'),
+                                            ('root', 'unsigned long')])
+    image.define('struct kernfs_elem_symlink',
+                 [('target_kn', 'struct kernfs_node *')])
+    image.define('union kernfs_elem',
+                 [('dir', 'struct kernfs_elem_dir'),
+                  ('symlink', 'struct kernfs_elem_symlink')], union=True)
+    image.define('struct kernfs_node', [('count', 'int'), ('active', 'int'),
+                                        ('parent', 'struct kernfs_node *'),
+                                        ('name', 'char *'),
+                                        ('rb', 'struct rb_node'),
+                                        ('ns', 'unsigned long'),
+                                        ('hash', 'unsigned int'),
+                                        ('u', 'union kernfs_elem'),
+                                        ('priv', 'unsigned long'),
+                                        ('id', 'u64'),
+                                        ('flags', 'unsigned short'),
+                                        ('mode', 'unsigned short')])
+    # The kernel uses an anonymous union
+    kn = image.types['struct kernfs_node']
+    (off, elem) = kn.fields['u']
+    for name in ('dir', 'symlink'):
+        kn.fields[name] = (off, elem.fields[name][1])
+
+    image.define('struct cpumask', [('bits', 'unsigned long[8]')])
+    image.define('struct ns_common', [('stashed', 'unsigned long'),
+                                      ('ops', 'unsigned long'),
+                                      ('inum', 'unsigned int')])
+    image.define('struct net', [('list', 'struct list_head'),
+                                ('ns', 'struct ns_common'),
+                                ('dev_base_head', 'struct list_head')])
+    image.define('struct net_device', [('name', 'char[16]'),
+                                       ('dev_list', 'struct list_head'),
+                                       ('ifindex', 'int'),
+                                       ('pcpu_refcnt', 'int *')])
+
+    image.define('struct xarray', [('xa_lock', 'unsigned int'),
+                                   ('xa_flags', 'unsigned int'),
+                                   ('xa_head', 'unsigned long')])
+    image.define('struct xa_node', [('shift', 'unsigned char'),
+                                    ('offset', 'unsigned char'),
+                                    ('count', 'unsigned char'),
+                                    ('nr_values', 'unsigned char'),
+                                    ('parent', 'struct xa_node *'),
+                                    ('array', 'struct xarray *'),
+                                    ('private_list', 'struct list_head'),
+                                    ('slots', 'unsigned long[64]'),
+                                    ('marks', 'unsigned long[3]')])
+
+    image.enums.update({'KERNFS_DIR': 0x0001, 'KERNFS_FILE': 0x0002,
+                        'KERNFS_LINK': 0x0004, 'KERNFS_NS': 0x0020,
+                        # v6.8+ x86_64 without CONFIG_LOCKDEP
+                        '___GFP_LAST_BIT': 26})
+
+    # Per-cpu areas: cpu N's copy of a per-cpu variable at template address
+    # A lives at A + __per_cpu_offset[N]
+    image.percpu_size = 1 << 20
+    image.percpu_template = image.alloc(image.percpu_size, 4096)
+    image.percpu_used = 0
+    offsets = []
+    for cpu in range(ncpus):
+        base = image.alloc(image.percpu_size, 4096)
+        offsets.append(base - image.percpu_template)
+    image.add_symbol('__per_cpu_offset', 'unsigned long[512]',
+                     value=offsets)
+
+    bits = [0] * 8
+    for cpu in range(ncpus):
+        bits[cpu // 64] |= 1 << (cpu % 64)
+    mask = image.new('struct cpumask', bits=bits)
+    image.add_symbol('cpu_possible_mask', 'struct cpumask *', value=mask)
+    image.add_symbol('nr_cpu_ids', 'unsigned int', value=ncpus)
+    return image
+
+
+def alloc_percpu(image, typename):
+    '''
+    Allocate a per-cpu variable and return its (template) address
+    '''
+    size = image.type(typename).size
+    image.percpu_used = (image.percpu_used + size - 1) & ~(size - 1)
+    addr = image.percpu_template + image.percpu_used
+    image.percpu_used += size
+    return addr
+
+
+def per_cpu_addrs(image, addr):
+    '''
+    Return the addresses of all copies of a per-cpu variable
+    '''
+    ncpus = image.read_symbol('nr_cpu_ids')
+    return [addr + off
+            for off in image.read_symbol('__per_cpu_offset')[:ncpus]]
+
+
+def gen_rb_tree(image, nodes, keyfunc=None):
+    '''
+    Link the given rb_node addresses into a balanced tree (in the given
+    order, or sorted by keyfunc) and return the root rb_node address (or 0)
+    '''
+    if keyfunc is not None:
+        nodes = sorted(nodes, key=keyfunc)
+
+    def _link(lo, hi, parent, depth):
+        if lo >= hi:
+            return 0
+        mid = (lo + hi) // 2
+        node = nodes[mid]
+        # Color: RB_RED = 0, RB_BLACK = 1
+        color = 0 if depth % 2 else 1
+        image.store(node, 'struct rb_node', '__rb_parent_color',
+                    parent | color)
+        image.store(node, 'struct rb_node', 'rb_left',
+                    _link(lo, mid, node, depth + 1))
+        image.store(node, 'struct rb_node', 'rb_right',
+                    _link(mid + 1, hi, node, depth + 1))
+        return node
+
+    return _link(0, len(nodes), 0, 0)
+
+
+def gen_rbtree(image, count):
+    '''
+    Generate an rb tree with count nodes and return its rb_root address
+    '''
+    nodes = [image.new('struct rb_node') for i in range(count)]
+    return image.new('struct rb_root', rb_node=gen_rb_tree(image, nodes))
+
+
+def gen_list(image, typename, member, count, shuffle=False):
+    '''
+    Generate a list_head list of count objects of the given type, linked
+    through member (in allocation order or shuffled), and return the
+    address of its head
+    '''
+    import random
+
+    offset = image.type(typename).offset(member)
+    head = image.new('struct list_head')
+    nodes = [image.new(typename) + offset for i in range(count)]
+    if shuffle:
+        random.Random(count).shuffle(nodes)
+    ring = [head] + nodes
+    for (i, node) in enumerate(ring):
+        image.store(node, 'struct list_head', 'next',
+                    ring[(i + 1) % len(ring)])
+        image.store(node, 'struct list_head', 'prev', ring[i - 1])
+    return head
+
+
+def gen_xarray(image, entries, marks=None):
+    '''
+    Generate an xarray from a dict of index -> entry (non-zero pointers or
+    value entries) and a dict of mark -> set of marked indices, and return
+    its address
+    '''
+    marks = marks or {}
+    xa = image.new('struct xarray')
+    items = sorted(entries.items())
+    if not items:
+        return xa
+    if len(items) == 1 and items[0][0] == 0:
+        # The marks of a single entry are kept in xa_flags (XA_FLAGS_MARK())
+        flags = 0
+        for (mark, indices) in marks.items():
+            if 0 in indices:
+                flags |= 1 << (image.enums['___GFP_LAST_BIT'] + mark)
+        image.store(xa, 'struct xarray', 'xa_flags', flags)
+        image.store(xa, 'struct xarray', 'xa_head', items[0][1])
+        return xa
+
+    def _build(items, shift, parent, offset):
+        node = image.new('struct xa_node', shift=shift, offset=offset,
+                         parent=parent, array=xa)
+        groups = {}
+        for (index, entry) in items:
+            groups.setdefault((index >> shift) & 63, []).append((index,
+                                                                 entry))
+        slots = [0] * 64
+        bits = [0] * 3
+        for (off, group) in groups.items():
+            if shift == 0:
+                slots[off] = group[0][1]
+            else:
+                slots[off] = _build(group, shift - 6, node, off) | 2
+            for (mark, indices) in marks.items():
+                if any(index in indices for (index, entry) in group):
+                    bits[mark] |= 1 << off
+        image.store(node, 'struct xa_node', 'count', len(groups))
+        image.store(node, 'struct xa_node', 'slots', slots)
+        image.store(node, 'struct xa_node', 'marks', bits)
+        return node
+
+    shift = 0
+    while items[-1][0] >> shift >= 64:
+        shift += 6
+    image.store(xa, 'struct xarray', 'xa_head', _build(items, shift, 0, 0) | 2)
+    return xa
+
+
+def gen_kernfs(image, depth=3, fanout=10, files=5, links=2):
+    '''
+    Generate a sysfs like kernfs hierarchy, with fanout directories per
+    level (depth levels deep), files files per directory and links links
+    per leaf directory (pointing to other leaf directories). Sets the
+    sysfs_root_kn symbol and returns the root node address.
+    '''
+    from pykdumplib.linux import kernfs
+
+    dir_type = image.enums['KERNFS_DIR']
+    file_type = image.enums['KERNFS_FILE']
+    link_type = image.enums['KERNFS_LINK']
+    # Like a 64-bit v4.8+ kernel
+    end_name_hash = kernfs._end_name_hash_64
+    kn_type = image.type('struct kernfs_node')
+    rb_offset = kn_type.offset('rb')
+    children = {}
+
+    def _new(name, parent, flags, target=0):
+        kn = image.new('struct kernfs_node', name=image.new_string(name),
+                       parent=parent, flags=flags, count=1,
+                       hash=kernfs.kernfs_name_hash(name, end_name_hash))
+        if flags == link_type:
+            image.store(kn, 'struct kernfs_node', 'symlink',
+                        {'target_kn': target})
+        if parent:
+            children.setdefault(parent, []).append((kn, name))
+        return kn
+
+    root = _new('', 0, dir_type)
+    leaves = []
+
+    def _populate(parent, level):
+        for i in range(files):
+            _new('attr%d' % i, parent, file_type)
+        if level == depth:
+            leaves.append(parent)
+            return
+        for i in range(fanout):
+            _populate(_new('dir%d' % i, parent, dir_type), level + 1)
+
+    _populate(_new('devices', root, dir_type), 1)
+    cls = _new('class', root, dir_type)
+    for (i, leaf) in enumerate(leaves):
+        for j in range(links):
+            _new('link%d' % j, leaf, link_type,
+                 target=leaves[(i + j + 1) % len(leaves)])
+    for (i, leaf) in enumerate(leaves):
+        _new('dev%d' % i, cls, link_type, target=leaf)
+
+    hashes = {}
+    for (parent, kns) in children.items():
+        for (kn, name) in kns:
+            hashes[kn] = (kn_type.decode(image, kn).hash, name)
+        rb = gen_rb_tree(image, [kn + rb_offset for (kn, name) in kns],
+                         keyfunc=lambda rb: hashes[rb - rb_offset])
+        image.store(parent, 'struct kernfs_node', 'dir.children.rb_node', rb)
+        image.store(parent, 'struct kernfs_node', 'dir.subdirs', len(kns))
+
+    image.add_symbol('sysfs_root_kn', 'struct kernfs_node *', value=root)
+    return root
+
+
+def gen_netdevs(image, nets=1, devices=100, refcnt=lambda i, cpu: 1):
+    '''
+    Generate nets network namespaces with devices network devices each and
+    the net_namespace_list symbol. refcnt(ifindex, cpu) returns the per-cpu
+    reference count of a device.
+    '''
+    def _list_init(addr):
+        image.store(addr, 'struct list_head', 'next', addr)
+        image.store(addr, 'struct list_head', 'prev', addr)
+
+    def _list_add_tail(new, head):
+        prev = image.types['unsigned long'].decode(image, head + 8)
+        image.store(new, 'struct list_head', 'next', head)
+        image.store(new, 'struct list_head', 'prev', prev)
+        image.store(prev, 'struct list_head', 'next', new)
+        image.store(head, 'struct list_head', 'prev', new)
+
+    head = image.add_symbol('net_namespace_list', 'struct list_head')
+    _list_init(head)
+    net_type = image.type('struct net')
+    dev_type = image.type('struct net_device')
+    for n in range(nets):
+        # init_net has inode number 0xf0000098 (PROC_NET_INIT_INO)
+        net = image.new('struct net', ns={'inum': 0xf0000098 + n})
+        _list_add_tail(net + net_type.offset('list'), head)
+        dev_head = net + net_type.offset('dev_base_head')
+        _list_init(dev_head)
+        for i in range(devices):
+            ifindex = i + 1
+            pcpu = alloc_percpu(image, 'int')
+            for (cpu, addr) in enumerate(per_cpu_addrs(image, pcpu)):
+                image.types['int'].encode(image, addr, refcnt(ifindex, cpu))
+            dev = image.new('struct net_device',
+                            name='lo' if i == 0 else 'veth%d' % (i - 1),
+                            ifindex=ifindex, pcpu_refcnt=pcpu)
+            _list_add_tail(dev + dev_type.offset('dev_list'), dev_head)
+
+
+def gen_s390x_pagetables(image, regions=4, tables=64, large=64):
+    '''
+    Generate s390x kernel page tables with a region-third table as the top
+    level. The first regions region-third entries (2 GB each) point to
+    segment tables, which have tables entries pointing to page tables and
+    large entries mapping 1 MB large pages each. Returns the maximum
+    address covered by the populated regions.
+    '''
+    for t in ('pgd', 'p4d', 'pud', 'pmd', 'pte'):
+        image.define('%s_t' % t, [(t, 'unsigned long')])
+    image.define('struct mm_struct', [('pgd', 'pgd_t *')])
+    image.define('struct lowcore', [('pad', 'unsigned char[904]'),
+                                    ('kernel_asce', 'unsigned long')])
+
+    _REGION_ENTRY_TYPE_R3 = 0x04
+    _REGION3_ENTRY_EMPTY = 0x24
+    _SEGMENT_ENTRY_EMPTY = 0x20
+    _SEGMENT_ENTRY_LARGE = 0x400
+    _PAGE_PROTECT = 0x200
+    _PAGE_INVALID = 0x400
+    _PAGE_NOEXEC = 0x100
+
+    u64 = image.types['unsigned long']
+    r3 = image.alloc(2048 * 8, 16384)
+    for i in range(2048):
+        entry = _REGION3_ENTRY_EMPTY
+        if i < regions:
+            sto = image.alloc(2048 * 8, 16384)
+            entry = sto | _REGION_ENTRY_TYPE_R3
+            for j in range(2048):
+                seg = _SEGMENT_ENTRY_EMPTY
+                if j < tables:
+                    pto = image.alloc(256 * 8, 2048)
+                    seg = pto
+                    for k in range(256):
+                        # Vary the protection in runs to get some output
+                        prot = ((k // 64) & 1) * _PAGE_PROTECT
+                        if k % 128 >= 120:
+                            prot = _PAGE_INVALID
+                        addr = (((i * 2048 + j) * 256 + k) << 12)
+                        u64.encode(image, pto + k * 8,
+                                   addr | prot | _PAGE_NOEXEC)
+                elif j < tables + large:
+                    seg = (((i * 2048 + j) << 20) | _SEGMENT_ENTRY_LARGE |
+                           (j & 1) * _PAGE_PROTECT)
+                u64.encode(image, sto + j * 8, seg)
+        u64.encode(image, r3 + i * 8, entry)
+
+    image.add_symbol('init_mm', 'struct mm_struct', value={'pgd': r3})
+    image.add_symbol('lowcore', 'struct lowcore', addr=0)
+    image.store(0, 'struct lowcore', 'kernel_asce',
+                r3 | _REGION_ENTRY_TYPE_R3)
+    image.add_symbol('_stext', 'unsigned long', value=0x100000)
+    image.add_symbol('_end', 'unsigned long', value=0x2000000)
+    image.add_symbol('MODULES_VADDR', 'unsigned long', value=1 << 41)
+    image.add_symbol('VMALLOC_START', 'unsigned long', value=1 << 40)
+    image.add_symbol('vmemmap', 'unsigned long *', value=1 << 39)
+    return regions << 31
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Canonical Ltd.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+#
+# Profiling of the calls into pykdump.API
+#
+
+import json
+import sys
+import time
+
+import pykdump.API
+
+
+class Profiler(object):
+    '''
+    Count and time all calls into pykdump.API made by pykdumplib modules,
+    grouped by calling module and function.
+
+    The API functions are replaced in the globals of all loaded pykdumplib
+    modules (and the given extra modules, like a script) while the profiler
+    is enabled.
+    '''
+    def __init__(self, modules=()):
+        self.modules = list(modules)
+        self.stats = {}
+        self._patched = []
+
+    def _wrap(self, module_name, api_name, func):
+        stats = self.stats
+
+        def _wrapper(*args, **kwargs):
+            caller = sys._getframe(1).f_code.co_name
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                key = (module_name, caller, api_name)
+                stat = stats.get(key)
+                if stat is None:
+                    stats[key] = [1, elapsed]
+                else:
+                    stat[0] += 1
+                    stat[1] += elapsed
+        return _wrapper
+
+    def enable(self):
+        '''
+        Start profiling
+        '''
+        modules = [m for (n, m) in list(sys.modules.items())
+                   if n.startswith('pykdumplib') and m is not None and
+                   m is not sys.modules[__name__]]
+        for module in modules + self.modules:
+            for (name, value) in list(vars(module).items()):
+                if (callable(value) and not isinstance(value, type) and
+                        getattr(pykdump.API, name, None) is value):
+                    setattr(module, name, self._wrap(module.__name__, name,
+                                                     value))
+                    self._patched.append((module, name, value))
+
+    def disable(self):
+        '''
+        Stop profiling
+        '''
+        for (module, name, value) in self._patched:
+            setattr(module, name, value)
+        self._patched = []
+
+    def print_stats(self):
+        '''
+        Print a summary table, sorted by total time
+        '''
+        print('%-40s %-24s %10s %10s %10s' % ('CALLER', 'API', 'CALLS',
+                                              'TOTAL(s)', 'AVG(us)'))
+        for ((module, caller, api), (count, total)) in \
+                sorted(self.stats.items(), key=lambda s: s[1][1],
+                       reverse=True):
+            print('%-40s %-24s %10d %10.3f %10.1f' %
+                  (module + '.' + caller, api, count, total,
+                   total / count * 1e6))
+
+    def dump_stats(self, filename):
+        '''
+        Dump the stats in JSON format
+        '''
+        stats = [{'module': module, 'caller': caller, 'api': api,
+                  'calls': count, 'total': total}
+                 for ((module, caller, api), (count, total))
+                 in self.stats.items()]
+        with open(filename, 'w') as fh:
+            json.dump(stats, fh, indent=1)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Canonical Ltd.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+#
+# Structural diff of two kernfs (sysfs) trees, like from two dumps
+#
+# The trees are walked side by side, one directory at a time, so they're
+# never read completely up front. The nodes can be kernfs.Node (of a dump)
+# or snapshot.KernfsNode (of a snapshot file). The children of each
+# directory are merged by name (and type). The kernfs sort order can't be
+# used for that, because the name hashes of namespaced nodes are seeded
+# with the namespace pointer and the hash function differs between kernel
+# versions.
+#
+# Nodes can provide a signature attribute, a hash of their whole subtree
+# (see signatures()). Subtrees with the same signature on both sides are
+# skipped. Snapshot files store the signatures, so comparing two snapshots
+# only walks the subtrees that differ.
+#
+
+import hashlib
+from collections import namedtuple
+
+from pykdumplib import kernfsfind
+from pykdumplib import utils
+
+Change = namedtuple('Change', ['kind', 'path', 'old', 'new'])
+
+
+def _children(node):
+    '''
+    Return the children of a node sorted by (name, type). Children with the
+    same name and type (in different namespaces) stay in kernfs order.
+    '''
+    return sorted(node.iterchildren(), key=lambda c: (c.name, c.type))
+
+
+def _target(node, prefix):
+    '''
+    Return the target path of a link ('?' if it has no target or the target
+    isn't connected to the root)
+    '''
+    target = node.target()
+    if target is None:
+        return '?'
+    path = target.fullpath()
+    if path is None or path == 'Bad kernfs_node':
+        return '?'
+    return prefix + path
+
+
+def _size(node):
+    '''
+    Return the number of nodes of a subtree
+    '''
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.iterchildren())
+    return count
+
+
+def _describe(node, prefix):
+    if node.type == kernfsfind.KERNFS_LINK:
+        return '-> %s' % _target(node, prefix)
+    if node.type == kernfsfind.KERNFS_DIR:
+        return '(%d entries)' % (_size(node) - 1)
+    return None
+
+
+def signatures(rows, root):
+    '''
+    Compute the signatures of all nodes of a tree given as (addr, parent,
+    flags, name, target) rows and return a dict of addr -> signature. The
+    signature is a signed 64-bit hash of the type and link target path of a
+    node and of the names, types and signatures of its children, so equal
+    subtrees of different dumps have the same signature.
+    '''
+    nodes = {}
+    children = {}
+    for (addr, parent, flags, name, target) in rows:
+        nodes[addr] = (flags & kernfsfind.KERNFS_TYPE_MASK, name, target)
+        if addr != root:
+            children.setdefault(parent, []).append(addr)
+
+    # Paths (relative to the root, like fullpath()) top-down, then the
+    # signatures bottom-up
+    paths = {root: ''}
+    order = []
+    stack = [root]
+    while stack:
+        addr = stack.pop()
+        order.append(addr)
+        for child in children.get(addr, []):
+            paths[child] = paths[addr] + '/' + nodes[child][1]
+            stack.append(child)
+
+    sigs = {}
+    for addr in reversed(order):
+        (ntype, name, target) = nodes[addr]
+        target = paths.get(target, '?') if target is not None else ''
+        entries = sorted((nodes[c][1], nodes[c][0], sigs[c])
+                         for c in children.get(addr, []))
+        digest = hashlib.blake2b(repr((ntype, target, entries)).encode(),
+                                 digest_size=8).digest()
+        sigs[addr] = int.from_bytes(digest, 'little', signed=True)
+    return sigs
+
+
+def diff(old, new, prefix='/sys'):
+    '''
+    Compare the trees below the (root) nodes old and new and return a list
+    of Change tuples (sorted by path). kind is one of 'added', 'removed' or
+    'retargeted' (for links) and old and new describe the entry in the old
+    and new tree.
+    '''
+    changes = []
+    stack = [(old, new, prefix)]
+    while stack:
+        (a, b, path) = stack.pop()
+        sig = getattr(a, 'signature', None)
+        if sig is not None and sig == getattr(b, 'signature', None):
+            continue
+        ca = _children(a)
+        cb = _children(b)
+        i = j = 0
+        while i < len(ca) or j < len(cb):
+            ka = (ca[i].name, ca[i].type) if i < len(ca) else None
+            kb = (cb[j].name, cb[j].type) if j < len(cb) else None
+            if kb is None or (ka is not None and ka < kb):
+                changes.append(Change('removed', path + '/' + ka[0],
+                                      _describe(ca[i], prefix), None))
+                i += 1
+                continue
+            if ka is None or kb < ka:
+                changes.append(Change('added', path + '/' + kb[0], None,
+                                      _describe(cb[j], prefix)))
+                j += 1
+                continue
+
+            (x, y) = (ca[i], cb[j])
+            i += 1
+            j += 1
+            child = path + '/' + ka[0]
+            if x.type == kernfsfind.KERNFS_LINK:
+                (tx, ty) = (_target(x, prefix), _target(y, prefix))
+                if tx != ty:
+                    changes.append(Change('retargeted', child, tx, ty))
+            elif x.type == kernfsfind.KERNFS_DIR:
+                stack.append((x, y, child))
+
+    changes.sort(key=lambda c: c.path)
+    return changes
+
+
+def print_diff(changes):
+    '''
+    Print a list of Change tuples
+    '''
+    for c in changes:
+        if c.kind == 'added':
+            utils.cprint('+ %s' % c.path, end='', type='add')
+            utils.cprint(' %s' % c.new if c.new else '')
+        elif c.kind == 'removed':
+            utils.cprint('- %s' % c.path, end='', type='remove')
+            utils.cprint(' %s' % c.old if c.old else '')
+        else:
+            utils.cprint('~ %s' % c.path, end='', type='link')
+            utils.cprint(' -> %s (was %s)' % (c.new, c.old))
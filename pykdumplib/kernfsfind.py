@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Canonical Ltd.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+#
+# Path pattern lookups in kernfs (sysfs) trees
+#
+# The lookups only use the name and type attributes and the child(),
+# iterchildren() and target() methods of the nodes, so they work on the
+# nodes of a dump (kernfs.Node) as well as on the nodes of a snapshot file
+# (snapshot.KernfsNode). The node types are defined here for all the kernfs
+# modules that don't use pykdump.
+#
+
+import fnmatch
+import re
+
+# enum kernfs_node_type (unchanged since kernfs was introduced)
+KERNFS_TYPE_MASK = 0x000f
+KERNFS_DIR = 0x0001
+KERNFS_FILE = 0x0002
+KERNFS_LINK = 0x0004
+
+
+def _is_literal(component, regex):
+    '''
+    Return True if a path pattern component doesn't contain any wildcards
+    '''
+    if regex:
+        return re.escape(component) == component
+    return not any(c in component for c in '*?[')
+
+
+def _compile(component, regex):
+    '''
+    Compile a path pattern component into a match function
+    '''
+    if _is_literal(component, regex):
+        return component.__eq__
+    if regex:
+        return re.compile(component).fullmatch
+    return re.compile(fnmatch.translate(component)).match
+
+
+def find(node, pattern, regex=False):
+    '''
+    Find all nodes matching a path pattern (relative to node) and yield
+    (path, node) tuples. The components of the pattern are glob patterns (or
+    regular expressions if regex is True) and '**' matches any number of
+    directories. Only directories whose names match are descended into and
+    literal components are looked up directly. Links are followed for all
+    but the last component and '**'.
+    '''
+    parts = []
+    for p in pattern.strip('/').split('/'):
+        if p == '' or (p == '**' and parts and parts[-1] == '**'):
+            continue
+        parts.append(p if p == '**' else (p, _is_literal(p, regex),
+                                           _compile(p, regex)))
+
+    seen = set()
+    for path, match in _find(node, parts, 0, ''):
+        if path not in seen:
+            seen.add(path)
+            yield path, match
+
+
+def _find(node, parts, i, path):
+    if i == len(parts):
+        yield path, node
+        return
+
+    if parts[i] == '**':
+        yield from _find(node, parts, i + 1, path)
+        for child in node.iterchildren():
+            if child.type == KERNFS_DIR:
+                yield from _find(child, parts, i, path + '/' + child.name)
+        return
+
+    component, literal, match = parts[i]
+    if literal:
+        child = node.child(component)
+        children = [child] if child else []
+    else:
+        children = (c for c in node.iterchildren() if match(c.name))
+
+    last = (i == len(parts) - 1)
+    for child in children:
+        if last:
+            yield path + '/' + child.name, child
+        else:
+            target = child.target()
+            if target and target.type == KERNFS_DIR:
+                yield from _find(target, parts, i + 1,
+                                 path + '/' + child.name)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Canonical Ltd.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+#
+# Struct layouts
+#
+# A Layout describes a subset of the fields of a struct. The field offsets
+# and the struct size are resolved once per dump (on first use) and the
+# fields are decoded from the raw memory with a single precompiled
+# struct.Struct, rather than through StructResult attribute lookups.
+#
+
+import struct
+from collections import namedtuple
+
+from pykdump.API import member_offset, struct_size
+
+from pykdumplib import memory
+from pykdumplib import utils
+
+
+def offsetof(sname, member):
+    '''
+    Return the offset of a member of a struct
+    '''
+    offset = member_offset(sname, member)
+    if offset < 0:
+        raise ValueError('%s has no member %s' % (sname, member))
+    return offset
+
+
+class Layout(object):
+    '''
+    Struct layout class.
+
+    fields is a list of (attr, member, fmt) tuples where member is the name
+    of a (direct) member of the struct or a function returning an offset
+    (for nested members) and fmt is the struct format of the member (in
+    native byte order) or None if only its offset is needed.
+
+    Decoded structs are namedtuples with the address of the struct as the
+    first field (addr), followed by the attrs of the fields with a format.
+    '''
+    def __init__(self, sname, fields):
+        self.sname = sname
+        self.fields = fields
+        self.tuple = namedtuple(sname.replace('struct ', '') + '_layout',
+                                ['addr'] + [f[0] for f in fields if f[2]])
+        utils.register_cache(self)
+        self.clear()
+
+    def clear(self):
+        self._struct = None
+        self._offsets = None
+        self._size = None
+
+    def _resolve(self):
+        offsets = {}
+        items = []
+        for (attr, member, fmt) in self.fields:
+            if callable(member):
+                offsets[attr] = member()
+            else:
+                offsets[attr] = offsetof(self.sname, member)
+            if fmt:
+                items.append((offsets[attr], attr, fmt))
+
+        # Build a single format for all the fields (in memory order, which
+        # can differ between kernel versions), padding the gaps between them
+        items.sort()
+        order = [i[1] for i in items]
+        self._perm = None
+        if order != list(self.tuple._fields[1:]):
+            self._perm = [order.index(attr) for attr in self.tuple._fields[1:]]
+        fmt = '='
+        pos = start = items[0][0] if items else 0
+        for (offset, attr, ffmt) in items:
+            if offset < pos:
+                raise ValueError('%s: Overlapping fields' % self.sname)
+            if offset > pos:
+                fmt += '%dx' % (offset - pos)
+            fmt += ffmt
+            pos = offset + struct.calcsize('=' + ffmt)
+
+        self._start = start
+        self._size = struct_size(self.sname)
+        self._offsets = offsets
+        self._struct = struct.Struct(fmt)
+
+    def _make(self, addr, values):
+        if self._perm is not None:
+            values = [values[i] for i in self._perm]
+        return self.tuple._make((addr,) + tuple(values))
+
+    @property
+    def size(self):
+        '''
+        Size of the struct
+        '''
+        if self._struct is None:
+            self._resolve()
+        return self._size
+
+    def offset(self, attr):
+        '''
+        Return the offset of a field
+        '''
+        if self._struct is None:
+            self._resolve()
+        return self._offsets[attr]
+
+    def decode(self, addr, data, offset=0):
+        '''
+        Decode the struct at addr from data, which holds the raw memory of
+        the struct at the given offset
+        '''
+        if self._struct is None:
+            self._resolve()
+        return self._make(addr, self._struct.unpack_from(data,
+                                                         offset + self._start))
+
+    def read(self, addr):
+        '''
+        Read and decode the struct at addr
+        '''
+        if self._struct is None:
+            self._resolve()
+        return self._make(addr, self._struct.unpack(
+            memory.read(addr + self._start, self._struct.size)))
+
+    def read_array(self, addr, count):
+        '''
+        Read and decode an array of count structs at addr
+        '''
+        size = self.size
+        data = memory.read(addr, count * size)
+        return [self.decode(addr + i * size, data, i * size)
+                for i in range(count)]
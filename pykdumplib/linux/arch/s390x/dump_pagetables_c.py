@@ -19,9 +19,10 @@
 
 from pykdump.API import *
 
+from pykdumplib import memory
 from pykdumplib import utils
-utils.include("page_h")
-utils.include("pgtable_h")
+from pykdumplib.linux.arch.s390x.page_h import *
+from pykdumplib.linux.arch.s390x.pgtable_h import *
 
 __PAGE_BAD = "__PAGE_BAD"
 
@@ -43,10 +44,12 @@ VMEMMAP_NR = 3
 VMALLOC_NR = 4
 MODULES_NR = 5
 
+# The kernel image and area start addresses are set by ptdump_init(), so that
+# this module can be imported without a dump (to print saved ranges)
 g_address_markers = [
     addr_marker(0, "Identity Mapping"),
-    addr_marker(readSymbol('_stext'), "Kernel Image Start"),
-    addr_marker(readSymbol('_end'), "Kernel Image End"),
+    addr_marker(0, "Kernel Image Start"),
+    addr_marker(0, "Kernel Image End"),
     # FIXME: (juergh) Kasan
     addr_marker(0, "vmemmap Area"),
     addr_marker(0, "vmalloc Area"),
@@ -55,12 +58,16 @@ g_address_markers = [
 ]
 
 class pg_state():
-    def __init__(self):
+    def __init__(self, records=None):
         self.level = 0
         self.current_prot = 0
         self.start_address = 0
         self.current_address = 0
         self.marker = 0
+        # If not None, the finished ranges and markers are appended to this
+        # list as (start, end, prot, level, marker) tuples instead of being
+        # printed
+        self.records = records
 
 def print_prot(pr, level):
     level_name = ("ASCE", "PGD", "PUD", "PMD", "PTE")
@@ -75,11 +82,42 @@ def print_prot(pr, level):
     else:
         a1 = "RO" if (pr & _PAGE_PROTECT) else "RW"
         a2 = "NX" if (pr & _PAGE_NOEXEC)  else "X"
-    print(fmt.format(level_name[level], a1, a2, pr))
+    utils.cprint(fmt.format(level_name[level], a1, a2, pr))
 
-def note_page(st, new_prot, level):
+def print_marker(name, first=False):
+    if first:
+        utils.cprint("---[ {:s} ] ---".format(name))
+    else:
+        utils.cprint("--- [ {:s} ] ---".format(name))
+
+def print_range(start, end, prot, level):
     units = "KMGTPE "
 
+    utils.cprint("0x{:016x}-0x{:016x} ".format(start, end), end='')
+    delta = (end - start) >> 10
+    while (not (delta & 0x3ff)) and units[1] != ' ':
+        delta >>= 10
+        units = units[1:]
+    utils.cprint("{:9d}{:s} ".format(delta, units[0]), end='')
+    print_prot(prot, level)
+
+def print_records(records):
+    '''
+    Print the records of a page table walk (see pg_state)
+    '''
+    for (i, (start, end, prot, level, marker)) in enumerate(records):
+        if marker is not None:
+            print_marker(marker, first=(i == 0))
+        else:
+            print_range(start, end, prot, level)
+
+def note_marker(st, name, first=False):
+    if st.records is None:
+        print_marker(name, first)
+    else:
+        st.records.append((None, None, None, None, name))
+
+def note_page(st, new_prot, level):
     prot = new_prot
     cur = st.current_prot
 
@@ -88,32 +126,32 @@ def note_page(st, new_prot, level):
         st.current_prot = new_prot
         st.level = level
         st.marker = g_address_markers.copy()
-        print("---[ {:s} ] ---".format(st.marker[0].name))
+        note_marker(st, st.marker[0].name, first=True)
     elif prot != cur or level != st.level or \
          st.current_address >= st.marker[1].start_address:
         # Print the actual finished series
-        print("0x{:016x}-0x{:016x} ".format(st.start_address,
-                                            st.current_address), end='')
-        delta = (st.current_address - st.start_address) >> 10
-        while (not (delta & 0x3ff)) and units[1] != ' ':
-            delta >>= 10
-            units = units[1:]
-        print("{:9d}{:s} ".format(delta, units[0]), end='')
-        print_prot(st.current_prot, st.level)
+        if st.records is None:
+            print_range(st.start_address, st.current_address,
+                        st.current_prot, st.level)
+        else:
+            st.records.append((st.start_address, st.current_address,
+                               st.current_prot, st.level, None))
         while st.current_address >= st.marker[1].start_address:
             st.marker.pop(0)
-            print("--- [ {:s} ] ---".format(st.marker[0].name))
+            note_marker(st, st.marker[0].name)
         st.start_address = st.current_address
         st.current_prot = new_prot
         st.level = level
 
 def walk_pte_level(st, pmd, addr):
+    # Read the whole page table at once (through the memory cache) rather
+    # than one pte_t at a time
+    ptes = memory.read_array('Q', pmd_deref(pmd), PTRS_PER_PTE)
     for i in range(0, PTRS_PER_PTE):
         if addr >= g_max_addr:
             break
         st.current_address = addr
-        pte = pte_offset_kernel(pmd, addr)
-        prot = pte_val(pte) & \
+        prot = ptes[pte_index(addr)] & \
             (_PAGE_PROTECT | _PAGE_INVALID | _PAGE_NOEXEC)
         note_page(st, prot, 4)
         addr += PAGE_SIZE
@@ -175,10 +213,10 @@ def walk_p4d_level(st, pgd, addr):
             not_page(st, _PAGE_INVALID, 2)
         addr += P4D_SIZE
 
-def walk_pgd_level():
+def walk_pgd_level(records=None):
     addr = 0
 
-    st = pg_state()
+    st = pg_state(records)
     for i in range(0, PTRS_PER_PGD):
         if addr >= g_max_addr:
             break
@@ -196,22 +234,36 @@ def walk_pgd_level():
     st.current_address = g_max_addr
     note_page(st, 0, 0);
 
-def ptdump_show(max_addr=0):
+def ptdump_init(max_addr=0):
     global g_max_addr
     global g_address_markers
 
     if max_addr == 0:
         S390_lowcore = readSU("struct lowcore", 0)
         if S390_lowcore.kernel_asce == 0:
-            print("Warning: S390_lowcore.kernel_asce = 0")
+            utils.cprint("Warning: S390_lowcore.kernel_asce = 0")
 
         g_max_addr = (S390_lowcore.kernel_asce & _REGION_ENTRY_TYPE_MASK) >> 2
         g_max_addr = 1 << (max_addr * 11 + 31)
     else:
         g_max_addr = max_addr
 
+    g_address_markers[KERNEL_START_ADDR].start_address = readSymbol('_stext')
+    g_address_markers[KERNEL_END_ADDR].start_address = readSymbol('_end')
     g_address_markers[MODULES_NR].start_address = readSymbol("MODULES_VADDR")
     g_address_markers[VMEMMAP_NR].start_address = Addr(readSymbol("vmemmap"))
     g_address_markers[VMALLOC_NR].start_address = readSymbol("VMALLOC_START")
 
+def ptdump_show(max_addr=0):
+    ptdump_init(max_addr)
     walk_pgd_level()
+
+def ptdump_ranges(max_addr=0):
+    '''
+    Walk the kernel page tables and return the list of (start, end, prot,
+    level, marker) records (see pg_state) rather than printing them
+    '''
+    ptdump_init(max_addr)
+    records = []
+    walk_pgd_level(records)
+    return records
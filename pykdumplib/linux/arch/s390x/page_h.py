@@ -19,6 +19,10 @@
 
 # File: arch/s390/include/asm/page.h
 
+import sys
+
+from pykdumplib import utils
+
 _PAGE_SHIFT = 12
 _PAGE_SIZE  = (1 << _PAGE_SHIFT)
 
@@ -30,3 +34,5 @@ def pmd_val(x): return ((x).pmd)
 def pud_val(x): return ((x).pud)
 def p4d_val(x): return ((x).p4d)
 def pgd_val(x): return ((x).pgd)
+
+__all__ = utils.get__all__(sys.modules[__name__])
@@ -20,6 +20,22 @@
 
 # File: /arch/s390/include/asm/pgtable.h
 
+import sys
+
+from pykdump.API import *
+
+from pykdumplib import layout
+from pykdumplib import utils
+from pykdumplib.linux.arch.s390x.page_h import *
+
+# The page table entries are decoded from the raw memory, the entry tuples
+# have the same attribute (like pmd) as the kernel types
+_ENTRY = dict((t, layout.Layout('%s_t' % t, ((t, t, 'Q'),)))
+              for t in ('pgd', 'p4d', 'pud', 'pmd', 'pte'))
+
+def _entry(t, table, index):
+    return _ENTRY[t].read(table + index * _ENTRY[t].size)
+
 _PAGE_NOEXEC  = 0x100
 _PAGE_PROTECT = 0x200
 _PAGE_INVALID = 0x400
@@ -156,7 +172,7 @@ def pud_index(address): return (((address) >> PUD_SHIFT) & (PTRS_PER_PUD-1))
 def pmd_index(address): return (((address) >> PMD_SHIFT) & (PTRS_PER_PMD-1))
 def pte_index(address): return (((address) >> PAGE_SHIFT) & (PTRS_PER_PTE-1))
 
-def pgd_offset(mm, address): return ((mm).pgd + pgd_index(address))
+def pgd_offset(mm, address): return _entry('pgd', int((mm).pgd), pgd_index(address))
 def pgd_offset_k(address): return pgd_offset(readSymbol("init_mm"), address)
 
 def pmd_deref(pmd): return (pmd_val(pmd) & _SEGMENT_ENTRY_ORIGIN)
@@ -165,23 +181,25 @@ def p4d_deref(pud): return (p4d_val(pud) & _REGION_ENTRY_ORIGIN)
 def pgd_deref(pgd): return (pgd_val(pgd) & _REGION_ENTRY_ORIGIN)
 
 def p4d_offset(pgd, address):
-    p4d = pgd
+    p4d = pgd.addr
     if ((pgd_val(pgd) & _REGION_ENTRY_TYPE_MASK) == _REGION_ENTRY_TYPE_R1):
         p4d = pgd_deref(pgd)
-    return readSU("p4d_t", p4d) + p4d_index(address)
+    return _entry('p4d', p4d, p4d_index(address))
 
 def pud_offset(p4d, address):
-    pud = p4d
+    pud = p4d.addr
     if ((p4d_val(p4d) & _REGION_ENTRY_TYPE_MASK) == _REGION_ENTRY_TYPE_R2):
         pud = p4d_deref(p4d);
-    return readSU("pud_t", pud) + pud_index(address)
+    return _entry('pud', pud, pud_index(address))
 
 def pmd_offset(pud, address):
-    pmd = pud
+    pmd = pud.addr
     if ((pud_val(pud) & _REGION_ENTRY_TYPE_MASK) == _REGION_ENTRY_TYPE_R3):
         pmd = pud_deref(pud);
-    return readSU("pmd_t", pmd) + pmd_index(address)
+    return _entry('pmd', pmd, pmd_index(address))
 
 # Find an entry in the lowest level page table..
-def pte_offset(pmd, addr): return readSU("pte_t", pmd_deref(pmd)) + pte_index(addr)
+def pte_offset(pmd, addr): return _entry('pte', pmd_deref(pmd), pte_index(addr))
 def pte_offset_kernel(pmd, address): return pte_offset(pmd, address)
+
+__all__ = utils.get__all__(sys.modules[__name__])
@@ -53,6 +53,15 @@ def per_cpu_ptr(ptr, cpu):
     return ptr + per_cpu_offset(cpu)
 
 
+def per_cpu_offsets():
+    '''
+    Return a list of (cpu, per-cpu offset) tuples for all possible cpus,
+    reading __per_cpu_offset only once
+    '''
+    offsets = readSymbol('__per_cpu_offset')
+    return [(cpu, offsets[cpu]) for cpu in for_each_possible_cpu()]
+
+
 def cpumask_check(cpu):
     if cpu >= nr_cpumask_bits:
         print('Warning: cpu >= nr_cpumask_bits')
@@ -26,6 +26,8 @@ from __future__ import print_function
 from pykdump.API import *
 
 from pykdumplib.linux import rbtree
+from pykdumplib import kernfsfind
+from pykdumplib import layout
 from pykdumplib import utils
 
 
@@ -33,31 +35,169 @@ KERNFS_TYPE_MASK = 0x000f
 KERNFS_DIR = enumerator_value('KERNFS_DIR')
 KERNFS_FILE = enumerator_value('KERNFS_FILE')
 KERNFS_LINK = enumerator_value('KERNFS_LINK')
+KERNFS_NS = enumerator_value('KERNFS_NS')
 
+INT_MAX = 0x7fffffff
+GOLDEN_RATIO_32 = 0x61c88647
+GOLDEN_RATIO_64 = 0x61c8864680b583eb
 
-def _print_node(node, indent=0):
+
+def _union_offset(member):
+    '''
+    Return the offset of a member of the anonymous union of struct
+    kernfs_node (dir, symlink or attr). member_offset() doesn't resolve
+    members of anonymous unions with all pykdump versions, so fall back to
+    the member address of the StructResult of the sysfs root node.
+    '''
+    offset = member_offset('struct kernfs_node', member)
+    if offset < 0:
+        kn = readSU('struct kernfs_node', readSymbol('sysfs_root_kn'))
+        offset = Addr(getattr(kn, member)) - Addr(kn)
+    return offset
+
+
+KERNFS_NODE = layout.Layout('struct kernfs_node', (
+    ('parent', 'parent', 'Q'),
+    ('rb', 'rb', None),
+    ('ns', 'ns', 'Q'),
+    ('hash', 'hash', 'I'),
+    ('children', lambda: (_union_offset('dir') +
+                          layout.offsetof('struct kernfs_elem_dir',
+                                          'children')), 'Q'),
+    ('target_kn', lambda: (_union_offset('symlink') +
+                           layout.offsetof('struct kernfs_elem_symlink',
+                                           'target_kn')), 'Q'),
+    ('flags', 'flags', 'H'),
+))
+
+
+# end_name_hash() is a plain truncation before v4.8 and hash_long(hash, 32)
+# since, which is hash_64() on 64-bit and __hash_32() on 32-bit kernels
+
+def _end_name_hash_old(hash):
+    return hash & 0xffffffff
+
+
+def _end_name_hash_32(hash):
+    # __hash_32()
+    return ((hash & 0xffffffff) * GOLDEN_RATIO_32) & 0xffffffff
+
+
+def _end_name_hash_64(hash):
+    # hash_64(hash, 32)
+    return ((hash * GOLDEN_RATIO_64) & 0xffffffffffffffff) >> 32
+
+
+# The end_name_hash() variant used by the running kernel, determined on first
+# use by comparing against the hash of an existing node
+_end_name_hash = None
+
+
+def kernfs_name_hash(name, end_name_hash):
+    '''
+    Return the hash of a (non-namespaced) kernfs node name, see
+    fs/kernfs/dir.c
+    '''
+    hash = 0
+    for c in name.encode():
+        hash = ((hash + (c << 4) + (c >> 4)) * 11) & 0xffffffffffffffff
+    hash = end_name_hash(hash)
+    hash &= INT_MAX
+    # Reserve hash numbers 0, 1 and INT_MAX for magic directory entries
+    if hash < 2:
+        hash += 2
+    if hash >= INT_MAX:
+        hash = INT_MAX - 1
+    return hash
+
+
+def _calibrate_name_hash(node):
+    '''
+    Determine which end_name_hash() variant the kernel uses
+    '''
+    global _end_name_hash
+
+    if node._raw.ns:
+        return
+    for end_name_hash in (_end_name_hash_64, _end_name_hash_32,
+                          _end_name_hash_old):
+        if kernfs_name_hash(node.name, end_name_hash) == node._raw.hash:
+            _end_name_hash = end_name_hash
+            return
+    # Unknown hash function, use linear child lookups
+    _end_name_hash = False
+
+
+# Cache of node address -> full path
+_paths = utils.register_cache({})
+
+
+def _fullpath(node, limit=100):
+    '''
+    Return the full path of a node, reusing and filling the path cache for
+    all its ancestors
+    '''
+    chain = []
+    path = None
+    while node:
+        path = _paths.get(node.addr())
+        if path is not None:
+            break
+        if len(chain) == limit:
+            return 'Bad kernfs_node'
+        chain.append(node)
+        node = node.parent()
+
+    for node in reversed(chain):
+        path = node.name if path is None else path + '/' + node.name
+        _paths[node.addr()] = path
+    return path
+
+
+def resolve_links(nodes):
     '''
-    Pretty print a kernfs node
+    Resolve the targets of all links in nodes in one batch and return a
+    dict of link address -> (target node, target path)
+    '''
+    result = {}
+    targets = {}
+    for node in nodes:
+        if node.type != KERNFS_LINK:
+            continue
+        target = node.target()
+        addr = target.addr()
+        if addr not in targets:
+            targets[addr] = (target, target.fullpath())
+        result[node.addr()] = targets[addr]
+    return result
+
+
+def _print_node(node, indent=0, links=None):
+    '''
+    Pretty print a kernfs node. links is the result of resolve_links() for
+    (at least) the node.
     '''
     sindent = ' ' * indent
+    if links is None:
+        links = resolve_links([node])
 
     if node.type == KERNFS_DIR:
             utils.cprint('%s%s' % (sindent, node.name), end='', type='dir')
-            print(' (%x)' % node.addr())
+            utils.cprint(' (%x)' % node.addr())
 
     elif node.type == KERNFS_LINK:
             utils.cprint('%s%s' % (sindent, node.name), end='', type='link')
-            print(' (%x) -> ' % node.addr(), end='')
+            utils.cprint(' (%x) -> ' % node.addr(), end='')
 
-            target = Node(node.struct.symlink.target_kn)
+            (target, path) = links[node.addr()]
             if target.type == KERNFS_DIR:
-                utils.cprint(target.fullpath(), end='', type='dir')
+                utils.cprint(path, end='', type='dir')
             else:
-                print(target.fullpath(), end='')
-            print(' (%x)' % target.addr())
+                utils.cprint(path, end='')
+            utils.cprint(' (%x)' % target.addr())
 
     else:
-        print('%s%s (%x)' % (sindent, node.name, node.addr()))
+        utils.cprint('%s%s (%x)' % (sindent, node.name, node.addr()))
 
 
 @utils.singleton
@@ -67,14 +207,54 @@ class Node(object):
     '''
     struct_type = 'struct kernfs_node'
 
-    def __init__(self, obj):
-        self.struct = obj
-        self.name = obj.name
-        self.type = obj.flags & KERNFS_TYPE_MASK
-        self._parent = obj.parent
+    def __init__(self, addr):
+        self._addr = addr
+        self._target = None
+
+    # The fields are only read on first access, so that walking through the
+    # tree doesn't read the names of all nodes passed by. The other fields
+    # are read all at once from the raw memory of the node.
+
+    @utils.lazy
+    def _raw(self):
+        return KERNFS_NODE.read(self._addr)
+
+    @utils.lazy
+    def name(self):
+        return self.struct.name
+
+    @utils.lazy
+    def type(self):
+        return self._raw.flags & KERNFS_TYPE_MASK
+
+    @utils.lazy
+    def flags(self):
+        return self._raw.flags
+
+    @utils.lazy
+    def hash(self):
+        return self._raw.hash
+
+    @utils.lazy
+    def ns(self):
+        # The namespace tag (or 0)
+        return self._raw.ns
+
+    @utils.lazy
+    def _parent(self):
+        return self._raw.parent
+
+    def _children(self):
+        # The struct rb_root of the children
+        return rbtree.Tree(self._addr + KERNFS_NODE.offset('children'))
+
+    @staticmethod
+    def _from_rb(node):
+        # container_of(node, struct kernfs_node, rb)
+        return Node(node._addr - KERNFS_NODE.offset('rb'))
 
     def addr(self):
-        return Addr(self.struct)
+        return self._addr
 
     def parent(self):
         return Node(self._parent)
@@ -84,14 +264,56 @@ class Node(object):
         Return the full path going all the way up to the root node. Limit to
         100 to prevent infinite loops.
         '''
-        path = []
-        node = self
-        while node and len(path) < limit:
-            path.insert(0, node.name)
-            node = node.parent()
-        if len(path) == limit:
-            return 'Bad kernfs_node'
-        return '/'.join(path)
+        return _fullpath(self, limit)
+
+    def child(self, name):
+        '''
+        Return the child node with the given name (or None)
+        '''
+        if self.type != KERNFS_DIR:
+            return None
+
+        tree = self._children()
+        if _end_name_hash is None and tree.root():
+            _calibrate_name_hash(self._from_rb(tree.root()))
+
+        if not _end_name_hash or self._raw.flags & KERNFS_NS:
+            # Namespaced children or unknown hash function, so no keyed
+            # lookup possible
+            for child in self.iterchildren():
+                if child.name == name:
+                    return child
+            return None
+
+        def _cmp(key, node):
+            kn = self._from_rb(node)
+            if key[0] != kn._raw.hash:
+                return -1 if key[0] < kn._raw.hash else 1
+            if key[1] != kn.name:
+                return -1 if key[1] < kn.name else 1
+            return 0
+
+        node = tree.find((kernfs_name_hash(name, _end_name_hash), name), _cmp)
+        if node is None:
+            return None
+        return self._from_rb(node)
+
+    def target(self):
+        '''
+        Return the target node of a link (or the node itself)
+        '''
+        if self.type != KERNFS_LINK:
+            return self
+        if self._target is None:
+            self._target = Node(self._raw.target_kn)
+        return self._target
+
+    def find(self, pattern, regex=False):
+        '''
+        Find all nodes matching a path pattern (relative to this node) and
+        yield (path, node) tuples, see kernfsfind.find()
+        '''
+        return kernfsfind.find(self, pattern, regex)
 
     def iterchildren(self):
         '''
@@ -100,19 +322,29 @@ class Node(object):
         if self.type != KERNFS_DIR:
             return
 
-        tree = rbtree.Tree(self.struct.dir.children)
-        for node in tree.iternodes():
-            yield Node(container_of(node.struct, 'struct kernfs_node', 'rb'))
+        for node in self._children().iternodes():
+            yield self._from_rb(node)
 
-    def pretty_print(self, level=1, indent=0):
+    def print_path(self, path):
         '''
-        Pretty print a node (tree)
+        Print a node with the given path
         '''
-        _print_node(self, indent)
+        ctype = {KERNFS_DIR: 'dir', KERNFS_LINK: 'link'}.get(self.type)
+        utils.cprint(path, end='', type=ctype)
+        utils.cprint(' (%x)' % self.addr())
+
+    def pretty_print(self, level=1, indent=0, links=None):
+        '''
+        Pretty print a node (tree). links is the result of resolve_links()
+        for (at least) the node, it's resolved if not given.
+        '''
+        _print_node(self, indent, links)
 
         if level == 1:
             return
 
         if self.type == KERNFS_DIR:
-            for child in self.iterchildren():
-                child.pretty_print(level - 1, indent + 3)
+            children = list(self.iterchildren())
+            links = resolve_links(children)
+            for child in children:
+                child.pretty_print(level - 1, indent + 3, links)
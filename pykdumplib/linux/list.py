@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Canonical Ltd.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+#
+# Linked list functions
+#
+# See:
+#   - include/linux/list.h
+#   - include/linux/list_nulls.h
+#   - include/linux/rculist.h
+#
+# The RCU variants of the lists (list_for_each_entry_rcu() and friends) have
+# the same memory layout, so they're walked with the same classes.
+#
+
+from pykdump.API import *
+
+from pykdumplib import layout
+from pykdumplib import memory
+from pykdumplib import utils
+
+
+LIST_HEAD = layout.Layout('struct list_head', (
+    ('next', 'next', 'Q'),
+))
+
+HLIST_HEAD = layout.Layout('struct hlist_head', (
+    ('first', 'first', 'Q'),
+))
+
+HLIST_NODE = layout.Layout('struct hlist_node', (
+    ('next', 'next', 'Q'),
+))
+
+HLIST_NULLS_HEAD = layout.Layout('struct hlist_nulls_head', (
+    ('first', 'first', 'Q'),
+))
+
+HLIST_NULLS_NODE = layout.Layout('struct hlist_nulls_node', (
+    ('next', 'next', 'Q'),
+))
+
+
+def is_a_nulls(ptr):
+    return ptr & 1
+
+
+def get_nulls_value(ptr):
+    return ptr >> 1
+
+
+class _List(object):
+    '''
+    Common list class, subclasses implement _iternodes()
+    '''
+    def __init__(self, addr):
+        self._addr = addr
+
+    def _follow(self, first, next_offset, end):
+        '''
+        Follow the next pointers (at next_offset) from first until end(ptr)
+        is true and yield the node addresses. Raises a ValueError on a NULL
+        pointer or a cycle.
+        '''
+        head = self._addr
+        seen = set()
+        node = first
+        while not end(node):
+            if not node:
+                raise ValueError('NULL pointer in list %x' % head)
+            if node in seen:
+                raise ValueError('Cycle in list %x at %x' % (head, node))
+            seen.add(node)
+            yield node
+            node = memory.read_ptr(node + next_offset)
+
+    def iternodes(self):
+        '''
+        Iterate through the addresses of all nodes of the list (excluding
+        the head)
+        '''
+        return self._iternodes()
+
+    def iterbatches(self, prefetch=64):
+        '''
+        Iterate through the node addresses in lists of up to prefetch
+        nodes, i.e., the list is followed at most prefetch nodes ahead of
+        the consumer
+        '''
+        batch = []
+        for node in self._iternodes():
+            batch.append(node)
+            if len(batch) == prefetch:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def iterentries(self, stype, member, decode=None, prefetch=64):
+        '''
+        Iterate through the objects of type stype containing the nodes as
+        member (like list_for_each_entry()). The member offset is resolved
+        only once. If decode (a layout.Layout of stype) is given, the
+        objects are yielded as decoded layout tuples rather than
+        StructResults, reading each batch of prefetch objects in address
+        order.
+        '''
+        offset = layout.offsetof(stype, member)
+        for batch in self.iterbatches(prefetch):
+            addrs = [node - offset for node in batch]
+            if decode is None:
+                for addr in addrs:
+                    yield readSU(stype, addr)
+                continue
+            # Read in address order, which makes the most of the read-ahead
+            # of the memory cache, but yield in list order
+            objs = dict((addr, decode.read(addr)) for addr in sorted(addrs))
+            for addr in addrs:
+                yield objs[addr]
+
+
+@utils.singleton
+class List(_List):
+    '''
+    Doubly linked list (struct list_head) class
+    '''
+    struct_type = 'struct list_head'
+
+    def _iternodes(self):
+        head = self._addr
+        next_offset = LIST_HEAD.offset('next')
+        first = memory.read_ptr(head + next_offset)
+        return self._follow(first, next_offset, lambda node: node == head)
+
+
+@utils.singleton
+class HList(_List):
+    '''
+    Hash list (struct hlist_head) class
+    '''
+    struct_type = 'struct hlist_head'
+
+    def _iternodes(self):
+        first = memory.read_ptr(self._addr + HLIST_HEAD.offset('first'))
+        return self._follow(first, HLIST_NODE.offset('next'),
+                            lambda node: node == 0)
+
+
+@utils.singleton
+class HListNulls(_List):
+    '''
+    Hash list with 'nulls' end markers (struct hlist_nulls_head) class
+    '''
+    struct_type = 'struct hlist_nulls_head'
+
+    def _iternodes(self):
+        first = memory.read_ptr(self._addr +
+                                HLIST_NULLS_HEAD.offset('first'))
+        return self._follow(first, HLIST_NULLS_NODE.offset('next'),
+                            is_a_nulls)
@@ -29,9 +29,18 @@ from __future__ import print_function
 
 from pykdump.API import *
 
+from pykdumplib import layout
+from pykdumplib import memory
 from pykdumplib import utils
 
 
+RB_NODE = layout.Layout('struct rb_node', (
+    ('parent_color', '__rb_parent_color', 'Q'),
+    ('rb_right', 'rb_right', 'Q'),
+    ('rb_left', 'rb_left', 'Q'),
+))
+
+
 @utils.singleton
 class Node(object):
     '''
@@ -39,11 +48,27 @@ class Node(object):
     '''
     struct_type = 'struct rb_node'
 
-    def __init__(self, obj):
-        self.struct = obj
-        self._parent = obj.__rb_parent_color & ~3
-        self._rb_left = obj.rb_left
-        self._rb_right = obj.rb_right
+    def __init__(self, addr):
+        self._addr = addr
+
+    # The fields are only read on first access, all at once from the raw
+    # memory of the node
+
+    @utils.lazy
+    def _raw(self):
+        return RB_NODE.read(self._addr)
+
+    @utils.lazy
+    def _parent(self):
+        return self._raw.parent_color & ~3
+
+    @utils.lazy
+    def _rb_left(self):
+        return self._raw.rb_left
+
+    @utils.lazy
+    def _rb_right(self):
+        return self._raw.rb_right
 
     def parent(self):
         return Node(self._parent)
@@ -90,9 +115,35 @@ class Tree(object):
     '''
     struct_type = 'struct rb_root'
 
-    def __init__(self, obj):
-        self.struct = obj
-        self._rb_node = obj.rb_node
+    def __init__(self, addr):
+        self._addr = addr
+
+    @utils.lazy
+    def _rb_node(self):
+        # rb_node is the only member of struct rb_root
+        return memory.read_ptr(self._addr)
+
+    def root(self):
+        '''
+        Return the root node of the tree
+        '''
+        return Node(self._rb_node)
+
+    def find(self, key, cmp):
+        '''
+        Find the node matching key, using cmp(key, node) which returns a
+        negative, zero or positive value (like rb_find() in the kernel)
+        '''
+        node = self.root()
+        while node:
+            c = cmp(key, node)
+            if c < 0:
+                node = node.left()
+            elif c > 0:
+                node = node.right()
+            else:
+                return node
+        return None
 
     def firstnode(self):
         '''
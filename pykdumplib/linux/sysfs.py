@@ -40,3 +40,17 @@ def Node(obj):
     Sysfs node class
     '''
     return kernfs.Node(obj)
+
+
+def find(pattern, regex=False, node=None):
+    '''
+    Find sysfs nodes matching a path pattern (relative to node, which
+    defaults to the root node) and yield (path, node) tuples
+    '''
+    if node is None:
+        node = Root()
+        if pattern == '/sys' or pattern.startswith('/sys/'):
+            pattern = pattern[4:]
+    prefix = '/sys' + node.fullpath()
+    for path, match in node.find(pattern, regex=regex):
+        yield prefix + path, match
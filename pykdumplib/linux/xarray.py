@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Canonical Ltd.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+#
+# XArray (and radix tree) functions
+#
+# See:
+#   - include/linux/xarray.h
+#   - lib/xarray.c
+#
+# Since v4.20, struct radix_tree_root is the same as struct xarray, so radix
+# trees can be walked as well.
+#
+
+import struct
+
+from pykdump.API import *
+
+from pykdumplib import layout
+from pykdumplib import memory
+from pykdumplib import utils
+
+
+XA_MARK_0 = 0
+XA_MARK_1 = 1
+XA_MARK_2 = 2
+XA_MAX_MARKS = 3
+
+# __GFP_BITS_SHIFT has been at least 22 since the XArray was introduced, so
+# the xa_flags bits below are never marks
+GFP_BITS_SHIFT_MIN = 22
+
+
+def _marks_offset():
+    '''
+    Return the offset of the marks of struct xa_node. marks is a member of
+    an anonymous union (with tags), which member_offset() doesn't resolve
+    with all pykdump versions. The union is the last member, right after
+    the slots, and holds XA_MAX_MARKS longs per XA_CHUNK_SIZE (at most 64)
+    slots.
+    '''
+    offset = member_offset('struct xa_node', 'marks')
+    if offset < 0:
+        slots = layout.offsetof('struct xa_node', 'slots')
+        chunk = (struct_size('struct xa_node') - slots - XA_MAX_MARKS * 8) // 8
+        offset = slots + chunk * 8
+    return offset
+
+
+XARRAY = layout.Layout('struct xarray', (
+    ('xa_flags', 'xa_flags', 'I'),
+    ('xa_head', 'xa_head', 'Q'),
+))
+
+XA_NODE = layout.Layout('struct xa_node', (
+    ('shift', 'shift', 'B'),
+    ('slots', 'slots', None),
+    ('marks', _marks_offset, None),
+))
+
+
+def xa_is_value(entry):
+    return entry & 1
+
+
+def xa_to_value(entry):
+    return entry >> 1
+
+
+def xa_is_internal(entry):
+    return (entry & 3) == 2
+
+
+def xa_mk_internal(v):
+    return (v << 2) | 2
+
+
+def xa_to_internal(entry):
+    return entry >> 2
+
+
+def xa_is_node(entry):
+    return xa_is_internal(entry) and entry > 4096
+
+
+def xa_to_node(entry):
+    return entry - 2
+
+
+XA_RETRY_ENTRY = xa_mk_internal(256)
+XA_ZERO_ENTRY = xa_mk_internal(257)
+
+
+# The node geometry (XA_CHUNK_SIZE depends on CONFIG_BASE_SMALL) and
+# __GFP_BITS_SHIFT, resolved once per dump
+_geometry = utils.register_cache({})
+
+
+def _node_geometry():
+    '''
+    Return the (chunk size, slots struct, marks struct) tuple
+    '''
+    if not _geometry:
+        slots = XA_NODE.offset('slots')
+        marks = XA_NODE.offset('marks')
+        chunk = (marks - slots) // 8
+        longs = (chunk + 63) // 64
+        _geometry['node'] = (chunk, struct.Struct('=%dQ' % chunk),
+                             struct.Struct('=%dQ' % (XA_MAX_MARKS * longs)))
+    return _geometry['node']
+
+
+def _gfp_bits_shift():
+    '''
+    Return __GFP_BITS_SHIFT (or None if it's unknown). It's only available
+    as an enumerator (___GFP_LAST_BIT) since v6.8, before it's a macro that
+    depends on the kernel version and config.
+    '''
+    if 'gfp' not in _geometry:
+        try:
+            _geometry['gfp'] = enumerator_value('___GFP_LAST_BIT')
+        except Exception:
+            _geometry['gfp'] = None
+    return _geometry['gfp']
+
+
+def xa_is_sibling(entry):
+    return (xa_is_internal(entry) and
+            entry < xa_mk_internal(_node_geometry()[0] - 1))
+
+
+def _read_node(addr):
+    '''
+    Read an xa_node with a single read and return the (shift, slots, marks)
+    tuple, where marks is a list of slot bitmaps (one per mark)
+    '''
+    (chunk, slots_struct, marks_struct) = _node_geometry()
+    data = memory.read(addr, XA_NODE.size)
+    node = XA_NODE.decode(addr, data)
+    slots = slots_struct.unpack_from(data, XA_NODE.offset('slots'))
+    longs = marks_struct.unpack_from(data, XA_NODE.offset('marks'))
+    n = len(longs) // XA_MAX_MARKS
+    marks = []
+    for m in range(XA_MAX_MARKS):
+        bits = 0
+        for (i, v) in enumerate(longs[m * n:(m + 1) * n]):
+            bits |= v << (i * 64)
+        marks.append(bits)
+    return (node.shift, slots, marks)
+
+
+def _set_bits(bits):
+    '''
+    Iterate through the set bits of a bitmap
+    '''
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+@utils.singleton
+class XArray(object):
+    '''
+    XArray class
+    '''
+    struct_type = 'struct xarray'
+
+    def __init__(self, addr):
+        self._addr = addr
+
+    @utils.lazy
+    def _raw(self):
+        return XARRAY.read(self._addr)
+
+    @utils.lazy
+    def _head(self):
+        return self._raw.xa_head
+
+    def _head_marked(self, mark):
+        '''
+        Return True if the single entry at index 0 (without a node) has the
+        mark. Its marks are kept in xa_flags, at XA_FLAGS_MARK(mark) (above
+        the gfp flags). Raises a ValueError if the entry has some mark but
+        __GFP_BITS_SHIFT is unknown.
+        '''
+        flags = self._raw.xa_flags
+        if not flags >> GFP_BITS_SHIFT_MIN:
+            return False
+        shift = _gfp_bits_shift()
+        if shift is None:
+            raise ValueError('xarray %x: Unknown __GFP_BITS_SHIFT, can\'t '
+                             'check the marks of the entry at index 0' %
+                             self._addr)
+        return bool(flags & (1 << (shift + mark)))
+
+    def load(self, index):
+        '''
+        Return the entry at index (or None), like xa_load()
+        '''
+        entry = self._head
+        if not xa_is_node(entry):
+            return entry if index == 0 and entry else None
+
+        (chunk, _, _) = _node_geometry()
+        while xa_is_node(entry):
+            (shift, slots, marks) = _read_node(xa_to_node(entry))
+            if index >> shift >= chunk and entry == self._head:
+                return None
+            offset = (index >> shift) & (chunk - 1)
+            entry = slots[offset]
+            if xa_is_sibling(entry):
+                entry = slots[xa_to_internal(entry)]
+        if not entry or entry in (XA_RETRY_ENTRY, XA_ZERO_ENTRY):
+            return None
+        return entry
+
+    def iterentries(self, mark=None):
+        '''
+        Iterate through all present entries (in index order) and yield
+        (index, entry) tuples. If mark is given, only the marked entries are
+        yielded and subtrees without the mark aren't read at all. Each node
+        is read with a single read.
+
+        A single entry at index 0 keeps its marks in xa_flags, at a position
+        that's only known on v6.8+ kernels. For older kernels, a ValueError
+        is raised if that entry has any mark (unmarked entries work).
+        '''
+        entry = self._head
+        if not entry:
+            return
+        if not xa_is_node(entry):
+            # A single entry at index 0
+            if xa_is_internal(entry):
+                return
+            if mark is None or self._head_marked(mark):
+                yield (0, entry)
+            return
+        yield from self._iternode(xa_to_node(entry), 0, mark)
+
+    def _iternode(self, addr, base, mark):
+        (shift, slots, marks) = _read_node(addr)
+        if mark is None:
+            offsets = (i for (i, e) in enumerate(slots) if e)
+        else:
+            offsets = _set_bits(marks[mark])
+
+        for offset in offsets:
+            entry = slots[offset]
+            if not entry:
+                continue
+            index = base + (offset << shift)
+            if xa_is_node(entry):
+                yield from self._iternode(xa_to_node(entry), index, mark)
+            elif not xa_is_internal(entry):
+                # Sibling, retry and zero entries are skipped
+                yield (index, entry)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Canonical Ltd.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+#
+# Memory access functions
+#
+# Target memory is read in (page sized) blocks through an LRU cache, with
+# sequential read-ahead. Values are decoded in native byte order, like the
+# rest of pykdumplib assumes that the dump is from the host architecture.
+#
+
+import struct
+from collections import OrderedDict
+
+from pykdump.API import readmem
+
+from pykdumplib import utils
+
+
+class PageCache(object):
+    '''
+    Read-through cache of target memory blocks.
+
+    capacity is the maximum number of cached blocks and blocksize the
+    (power of 2) size of a block. If a miss directly follows a miss of the
+    previous block, readahead blocks (at most capacity) are read with a
+    single readmem().
+    '''
+    def __init__(self, capacity=4096, blocksize=4096, readahead=8):
+        self.capacity = capacity
+        self.blocksize = blocksize
+        self.readahead = readahead
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+        self._last_miss = None
+        self._structs = {}
+
+    def clear(self):
+        self._blocks.clear()
+        self._last_miss = None
+
+    def _fetch(self, block):
+        '''
+        Read a block (and possibly the following ones) from the dump
+        '''
+        count = 1
+        if self._last_miss is not None and block == self._last_miss + 1:
+            # Don't read ahead more than fits, the requested block would be
+            # evicted again right away
+            count = max(1, min(self.readahead, self.capacity))
+        self._last_miss = block
+
+        start = block * self.blocksize
+        if count > 1:
+            try:
+                data = readmem(start, count * self.blocksize)
+            except Exception:
+                # Some of the blocks aren't readable
+                count = 1
+        if count == 1:
+            data = readmem(start, self.blocksize)
+
+        for i in range(count):
+            self._blocks[block + i] = data[i * self.blocksize:
+                                           (i + 1) * self.blocksize]
+            self._blocks.move_to_end(block + i)
+        while len(self._blocks) > self.capacity:
+            self._blocks.popitem(last=False)
+        return data[:self.blocksize]
+
+    def _block(self, block):
+        data = self._blocks.get(block)
+        if data is None:
+            self.misses += 1
+            return self._fetch(block)
+        self.hits += 1
+        self._blocks.move_to_end(block)
+        return data
+
+    def read(self, addr, size):
+        '''
+        Read size bytes at addr
+        '''
+        block = addr // self.blocksize
+        offset = addr % self.blocksize
+        if offset + size <= self.blocksize:
+            return self._block(block)[offset:offset + size]
+
+        chunks = []
+        while size > 0:
+            chunk = self._block(block)[offset:offset + size]
+            chunks.append(chunk)
+            size -= len(chunk)
+            block += 1
+            offset = 0
+        return b''.join(chunks)
+
+    def unpack(self, fmt, addr):
+        '''
+        Read and decode a (native byte order) struct format at addr
+        '''
+        s = self._structs.get(fmt)
+        if s is None:
+            s = self._structs[fmt] = struct.Struct('=' + fmt)
+        return s.unpack(self.read(addr, s.size))
+
+
+cache = utils.register_cache(PageCache())
+
+
+def configure(capacity=4096, blocksize=4096, readahead=8):
+    '''
+    Reconfigure (and clear) the memory cache
+    '''
+    cache.clear()
+    cache.capacity = capacity
+    cache.blocksize = blocksize
+    cache.readahead = readahead
+
+
+def read(addr, size):
+    return cache.read(addr, size)
+
+
+def read_array(fmt, addr, count):
+    '''
+    Read and decode an array of count elements of the given struct format
+    '''
+    return cache.unpack('%d%s' % (count, fmt), addr)
+
+
+def read_s32(addr):
+    return cache.unpack('i', addr)[0]
+
+
+def read_u32(addr):
+    return cache.unpack('I', addr)[0]
+
+
+def read_u64(addr):
+    return cache.unpack('Q', addr)[0]
+
+
+read_ptr = read_u64
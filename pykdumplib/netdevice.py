@@ -23,9 +23,190 @@
 
 from __future__ import print_function
 
+import json
+from collections import namedtuple
+
 from pykdump.API import *
-from pykdump.linux import kernel
-from pykdump import utils
+from pykdumplib.linux import list as klist
+from pykdumplib import layout
+from pykdumplib import memory
+from pykdumplib import utils
+
+
+IFNAMSIZ = 16
+
+NET_DEVICE = layout.Layout('struct net_device', (
+    ('name', 'name', '%ds' % IFNAMSIZ),
+    ('ifindex', 'ifindex', 'i'),
+    ('pcpu_refcnt', 'pcpu_refcnt', 'Q'),
+))
+
+
+DeviceRefcnt = namedtuple('DeviceRefcnt', ['addr', 'net', 'netns', 'ifindex',
+                                           'name', 'refcnt', 'pcpu_refcnt'])
+
+
+def for_each_net():
+    '''
+    Iterate through all network namespaces
+    '''
+    head = klist.List(readSymbol('net_namespace_list'))
+    for net in head.iterentries('struct net', 'list'):
+        yield net
+
+
+def for_each_netdev(net, decode=None):
+    '''
+    Iterate through all network devices of a network namespace (as decoded
+    layout tuples if decode is given, see klist.List.iterentries())
+    '''
+    head = klist.List(net.dev_base_head)
+    for dev in head.iterentries('struct net_device', 'dev_list',
+                                decode=decode):
+        yield dev
+
+
+def refcnt_table(offsets=None):
+    '''
+    Return a list of DeviceRefcnt tuples for all network devices of all
+    network namespaces. The per-cpu offsets are read only once for all
+    devices. netns is the inode number of the network namespace, which
+    (unlike its address) identifies it across dumps.
+    '''
+    # kernel reads symbols at import, so import it only when a dump is
+    # loaded (the snapshot functions work without one)
+    from pykdumplib.linux import kernel
+
+    if offsets is None:
+        offsets = kernel.per_cpu_offsets()
+
+    table = []
+    for net in for_each_net():
+        net_addr = Addr(net)
+        netns = int(net.ns.inum)
+        for raw in for_each_netdev(net, decode=NET_DEVICE):
+            percpu = {}
+            for (cpu, offset) in offsets:
+                percpu[cpu] = memory.read_s32(raw.pcpu_refcnt + offset)
+            name = raw.name.split(b'\0', 1)[0].decode(errors='replace')
+            table.append(DeviceRefcnt(raw.addr, net_addr, netns, raw.ifindex,
+                                      name, sum(percpu.values()), percpu))
+    return table
+
+
+def print_refcnt_table(table, percpu=False):
+    '''
+    Print a table of DeviceRefcnt tuples
+    '''
+    utils.cprint('%-16s %-16s %8s %-16s %8s' % ('NET_DEVICE', 'NET', 'IFINDEX',
+                                               'NAME', 'REFCNT'))
+    for d in table:
+        utils.cprint('%16x %16x %8d %-16s %8d' % (d.addr, d.net, d.ifindex,
+                                                  d.name, d.refcnt))
+        if percpu:
+            for cpu in sorted(d.pcpu_refcnt):
+                if d.pcpu_refcnt[cpu]:
+                    utils.cprint('%59s %8d' % ('cpu %d' % cpu,
+                                               d.pcpu_refcnt[cpu]))
+
+
+SNAPSHOT_VERSION = 2
+
+
+def save_refcnt_snapshot(filename, table=None):
+    '''
+    Save a table of DeviceRefcnt tuples (defaults to the current one) to a
+    JSON snapshot file
+    '''
+    if table is None:
+        table = refcnt_table()
+
+    devices = []
+    for d in table:
+        dev = d._asdict()
+        dev['pcpu_refcnt'] = sorted(d.pcpu_refcnt.items())
+        devices.append(dev)
+    with open(filename, 'w') as fh:
+        json.dump({'version': SNAPSHOT_VERSION, 'devices': devices}, fh)
+
+
+def load_refcnt_snapshot(filename):
+    '''
+    Load a JSON snapshot file and return a table of DeviceRefcnt tuples
+    '''
+    with open(filename) as fh:
+        snapshot = json.load(fh)
+    if snapshot.get('version') not in (1, SNAPSHOT_VERSION):
+        raise ValueError('%s: Unsupported snapshot version: %s' %
+                         (filename, snapshot.get('version')))
+
+    table = []
+    for dev in snapshot['devices']:
+        dev['pcpu_refcnt'] = dict(dev['pcpu_refcnt'])
+        # Version 1 snapshots don't have the namespace inode numbers
+        dev.setdefault('netns', None)
+        table.append(DeviceRefcnt(**dev))
+    return table
+
+
+def _snapshot_keys(table, netns=True):
+    '''
+    Return a dict of key -> DeviceRefcnt for a table. The key is the tuple
+    (netns, name, ifindex, n) where n only distinguishes devices with the
+    same name and ifindex in the same namespace, or in any namespace (in
+    list order) if netns is False. netns is None in the keys then.
+    '''
+    keys = {}
+    count = {}
+    for d in table:
+        key = (d.netns if netns else None, d.name, d.ifindex)
+        n = count.get(key, 0)
+        count[key] = n + 1
+        keys[key + (n,)] = d
+    return keys
+
+
+def compare_refcnt_snapshots(tables):
+    '''
+    Join two or more tables of DeviceRefcnt tuples by network namespace,
+    device name and ifindex and return a list of (netns, name, ifindex,
+    refcnts, growth) tuples, ranked by reference count growth (highest
+    first). refcnts holds the reference count of the device in each table
+    (or None if the device doesn't exist in that table) and growth is the
+    difference between the last and first known reference count.
+
+    If any table doesn't have the namespace inode numbers (version 1
+    snapshots), all tables are joined by name and ifindex only and netns is
+    None.
+    '''
+    netns = all(d.netns is not None for table in tables for d in table)
+    joined = {}
+    for (i, table) in enumerate(tables):
+        for (key, d) in _snapshot_keys(table, netns).items():
+            if key not in joined:
+                joined[key] = [None] * len(tables)
+            joined[key][i] = d.refcnt
+
+    result = []
+    for (key, refcnts) in joined.items():
+        known = [r for r in refcnts if r is not None]
+        result.append((key[0], key[1], key[2], refcnts,
+                       known[-1] - known[0]))
+    result.sort(key=lambda r: r[4], reverse=True)
+    return result
+
+
+def print_refcnt_comparison(result):
+    '''
+    Print the result of compare_refcnt_snapshots()
+    '''
+    utils.cprint('%-10s %-16s %8s %8s  %s' % ('NETNS', 'NAME', 'IFINDEX',
+                                              'GROWTH', 'REFCNTS'))
+    for (netns, name, ifindex, refcnts, growth) in result:
+        utils.cprint('%-10s %-16s %8d %+8d  %s' %
+                     ('-' if netns is None else netns, name, ifindex, growth,
+                      ' '.join('-' if r is None else str(r)
+                               for r in refcnts)))
 
 
 @utils.singleton
@@ -35,21 +216,26 @@ class Device(object):
     '''
     struct_type = 'struct net_device'
 
-    def __init__(self, obj):
-        self.struct = obj
-        self.name = obj.name
+    def __init__(self, addr):
+        self._addr = addr
+
+    @utils.lazy
+    def name(self):
+        return self.struct.name
 
     def refcnt(self, cpu=None):
         '''
         Return the (per-cpu) reference count
         '''
+        from pykdumplib.linux import kernel
+
         if cpu is None:
             # Return the sum of all ref counts
             refcnt = 0
-            for cpu in kernel.for_each_possible_cpu():
-                p = kernel.per_cpu_ptr(self.struct.pcpu_refcnt, cpu)
-                refcnt += readS32(p)
+            pcpu_refcnt = int(self.struct.pcpu_refcnt)
+            for (cpu, offset) in kernel.per_cpu_offsets():
+                refcnt += memory.read_s32(pcpu_refcnt + offset)
             return refcnt
         else:
-            p = kernel.per_cpu_ptr(self.struct.pcpu_refcnt, cpu)
-            return readS32(p)
+            p = kernel.per_cpu_ptr(int(self.struct.pcpu_refcnt), cpu)
+            return memory.read_s32(p)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Canonical Ltd.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+#
+# Persistent analysis session
+#
+
+import argparse
+import cmd
+import code
+import importlib.machinery
+import importlib.util
+import os
+import shlex
+import traceback
+
+from pykdumplib import utils
+
+
+def load_script(filename):
+    '''
+    Load a script (like sysfs or pgtable) as a module, without running its
+    main code
+    '''
+    name = 'pykdumplib_script_' + os.path.basename(filename)
+    loader = importlib.machinery.SourceFileLoader(name, filename)
+    spec = importlib.util.spec_from_loader(name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+class Session(cmd.Cmd):
+    '''
+    Persistent analysis session. Dispatches the 'do_' subcommands of one or
+    more scripts repeatedly without reloading them, so that all caches stay
+    warm until they are invalidated explicitly.
+    '''
+    intro = 'Type help for a list of commands.'
+    prompt = 'pykdumplib> '
+
+    def __init__(self, scripts):
+        cmd.Cmd.__init__(self)
+        self.scripts = scripts
+        self.parser = argparse.ArgumentParser(prog='', add_help=False)
+        subparsers = self.parser.add_subparsers(title='scripts',
+                                                dest='script')
+        subparsers.required = True
+        for (name, module) in sorted(scripts.items()):
+            parser = subparsers.add_parser(name, help='%s commands' % name)
+            utils.add_subcommand_parsers(parser, module)
+
+    @classmethod
+    def from_dir(cls, dirname, names):
+        '''
+        Create a session for the named scripts in the given directory.
+        Scripts which fail to load (for example because they're for a
+        different architecture) are skipped.
+        '''
+        scripts = {}
+        for name in names:
+            try:
+                scripts[name] = load_script(os.path.join(dirname, name))
+            except Exception as e:
+                print('Warning: Failed to load %s: %s' % (name, e))
+        return cls(scripts)
+
+    def run(self, line):
+        '''
+        Run a single script subcommand, for example 'sysfs show -l 2'
+        '''
+        try:
+            args = self.parser.parse_args(shlex.split(line))
+        except SystemExit:
+            # Parse error or help output
+            return
+        try:
+            args.func(args)
+        except Exception:
+            traceback.print_exc(chain=False)
+
+    def default(self, line):
+        self.run(line)
+
+    def emptyline(self):
+        pass
+
+    def do_help(self, arg):
+        '''
+        Show help for a command
+        '''
+        if arg in self.scripts:
+            self.run(arg + ' --help')
+        else:
+            self.parser.print_help()
+            cmd.Cmd.do_help(self, arg)
+
+    def do_invalidate(self, arg):
+        '''
+        Invalidate all caches
+        '''
+        utils.clear_caches()
+
+    def do_python(self, arg):
+        '''
+        Start an interactive Python console (exit with Ctrl-D)
+        '''
+        code.interact(local={'session': self})
+
+    def do_quit(self, arg):
+        '''
+        Quit the session
+        '''
+        return True
+
+    do_EOF = do_quit
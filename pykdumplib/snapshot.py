@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Canonical Ltd.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+#
+# Offline snapshots of extracted kernel structures
+#
+# export() (run in crash) writes the kernfs nodes of the sysfs tree, the
+# kernel page table ranges and the net device reference counts to an SQLite
+# file. Path lookups in the saved sysfs tree are answered from the database
+# (see kernfsfind). For everything else, a Snapshot rebuilds the kernfs
+# nodes at their original addresses in a synthetic image (see fakedump), so
+# that they can be queried with the regular kernfs and sysfs APIs without
+# crash.
+#
+# This module must not import pykdump, so that it can be used offline.
+#
+
+import os
+import sqlite3
+
+from pykdumplib import kernfsfind
+
+SNAPSHOT_VERSION = 3
+
+_SCHEMA = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE kernfs (addr INTEGER PRIMARY KEY, parent INTEGER, flags INTEGER,
+                     hash INTEGER, ns INTEGER, name TEXT, target INTEGER,
+                     sig INTEGER);
+CREATE TABLE ptdump (seq INTEGER PRIMARY KEY, start INTEGER, end INTEGER,
+                     prot INTEGER, level INTEGER, marker TEXT);
+CREATE TABLE netdev (addr INTEGER, net INTEGER, netns INTEGER,
+                     ifindex INTEGER, name TEXT, refcnt INTEGER);
+CREATE TABLE netdev_pcpu (addr INTEGER, cpu INTEGER, refcnt INTEGER);
+'''
+
+# Index for the child lookups by name (created on open for older files)
+_INDEX = '''
+CREATE INDEX IF NOT EXISTS kernfs_parent_name ON kernfs (parent, name);
+'''
+
+
+def _s64(value):
+    '''
+    Convert an unsigned 64-bit value (address) to an SQLite integer
+    '''
+    if value is not None and value >= 1 << 63:
+        return value - (1 << 64)
+    return value
+
+
+def _u64(value):
+    '''
+    Convert an SQLite integer back to an unsigned 64-bit value
+    '''
+    if value is not None and value < 0:
+        return value + (1 << 64)
+    return value
+
+
+def _page_bad(dump_pagetables_c):
+    # Use getattr() to prevent name mangling of __PAGE_BAD in classes
+    return getattr(dump_pagetables_c, '__PAGE_BAD')
+
+
+def _kernfs_rows(root):
+    '''
+    Walk a kernfs tree of the dump and return (addr, parent, flags, hash, ns,
+    name, target) rows of all nodes
+    '''
+    from pykdumplib.linux import kernfs
+
+    rows = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        target = None
+        if node.type == kernfs.KERNFS_LINK:
+            target = node.target().addr()
+        parent = node.parent()
+        rows.append((node.addr(), parent.addr() if parent else 0,
+                     node.flags, node.hash, node.ns, node.name, target))
+        stack.extend(node.iterchildren())
+    return rows
+
+
+def _export_kernfs(db):
+    from pykdumplib import kernfsdiff
+    from pykdumplib.linux import sysfs
+
+    root = sysfs.Root()
+    rows = _kernfs_rows(root)
+    sigs = kernfsdiff.signatures([(addr, parent, flags, name, target)
+                                  for (addr, parent, flags, hash, ns, name,
+                                       target) in rows], root.addr())
+    rows = [(_s64(addr), _s64(parent), flags, hash, _s64(ns), name,
+             _s64(target), sigs[addr])
+            for (addr, parent, flags, hash, ns, name, target) in rows]
+    db.executemany('INSERT INTO kernfs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                   rows)
+    db.execute('INSERT INTO meta VALUES (?, ?)',
+               ('sysfs_root_kn', str(root.addr())))
+
+
+def _export_ptdump(db, max_addr):
+    from pykdumplib import utils
+
+    try:
+        dump_pagetables_c = utils.arch_import('dump_pagetables_c')
+    except ImportError:
+        return
+    rows = []
+    for (seq, (start, end, prot, level, marker)) in \
+            enumerate(dump_pagetables_c.ptdump_ranges(max_addr=max_addr)):
+        if prot == _page_bad(dump_pagetables_c):
+            prot = None
+        rows.append((seq, _s64(start), _s64(end), prot, level, marker))
+    db.executemany('INSERT INTO ptdump VALUES (?, ?, ?, ?, ?, ?)', rows)
+    db.execute('INSERT INTO meta VALUES (?, ?)',
+               ('machine', utils.machine()))
+
+
+def _export_netdev(db):
+    from pykdumplib import netdevice
+
+    for d in netdevice.refcnt_table():
+        db.execute('INSERT INTO netdev VALUES (?, ?, ?, ?, ?, ?)',
+                   (_s64(d.addr), _s64(d.net), d.netns, d.ifindex, d.name,
+                    d.refcnt))
+        db.executemany('INSERT INTO netdev_pcpu VALUES (?, ?, ?)',
+                       [(_s64(d.addr), cpu, refcnt)
+                        for (cpu, refcnt) in d.pcpu_refcnt.items()])
+
+
+def export(filename, kernfs=True, ptdump=True, netdev=True, max_addr=0):
+    '''
+    Export the sysfs kernfs nodes, the kernel page table ranges (if
+    supported by the architecture) and the net device reference counts to
+    an SQLite snapshot file (replacing an existing file)
+    '''
+    if os.path.exists(filename):
+        os.remove(filename)
+    db = sqlite3.connect(filename)
+    with db:
+        db.executescript(_SCHEMA + _INDEX)
+        db.execute('INSERT INTO meta VALUES (?, ?)',
+                   ('version', str(SNAPSHOT_VERSION)))
+        if kernfs:
+            _export_kernfs(db)
+        if ptdump:
+            _export_ptdump(db, max_addr)
+        if netdev:
+            _export_netdev(db)
+    db.close()
+
+
+class Snapshot(object):
+    '''
+    Snapshot file
+    '''
+    def __init__(self, filename):
+        # sqlite3.connect() would create a missing file
+        if not os.path.isfile(filename):
+            raise ValueError('%s: No such snapshot file' % filename)
+        self.db = sqlite3.connect(filename)
+        try:
+            self.meta = dict(self.db.execute('SELECT key, value FROM meta'))
+        except sqlite3.DatabaseError:
+            raise ValueError('%s: Not a snapshot file' % filename)
+        if self.meta.get('version') not in ('1', '2', str(SNAPSHOT_VERSION)):
+            raise ValueError('%s: Unsupported snapshot version: %s' %
+                             (filename, self.meta.get('version')))
+        self.image = None
+        self._paths = {}
+        # Version 1 and 2 snapshots don't have the subtree signatures
+        self._kernfs_select = ('SELECT addr, parent, flags, hash, ns, name, '
+                               'target, %s FROM kernfs' %
+                               ('NULL' if self.meta['version'] in ('1', '2')
+                                else 'sig'))
+        try:
+            self.db.executescript(_INDEX)
+        except sqlite3.OperationalError:
+            # Read-only file, the lookups fall back to table scans
+            pass
+
+    def install(self):
+        '''
+        Rebuild the kernfs nodes (at their original addresses) in a synthetic
+        image and install it as the pykdump backend. Must be called before
+        any of the pykdumplib.linux modules are imported.
+        '''
+        from pykdumplib import fakedump
+
+        if self.image is not None:
+            fakedump.install(self.image)
+            return
+
+        rows = [(_u64(addr), _u64(parent), flags, hash, _u64(ns), name,
+                 _u64(target))
+                for (addr, parent, flags, hash, ns, name, target)
+                in self.db.execute('SELECT addr, parent, flags, hash, ns, '
+                                   'name, target FROM kernfs')]
+        rows.sort()
+        (max_cpu,) = self.db.execute('SELECT MAX(cpu) FROM '
+                                     'netdev_pcpu').fetchone()
+
+        # Allocate the synthetic objects above all original addresses
+        top = rows[-1][0] if rows else 0
+        base = (top + 2 * fakedump.PAGE_SIZE) & ~(fakedump.PAGE_SIZE - 1)
+        image = fakedump.kernel_image(ncpus=(max_cpu or 0) + 1,
+                                      base=max(base, fakedump.IMAGE_BASE))
+        fakedump.install(image)
+
+        kn_type = image.type('struct kernfs_node')
+        rb_offset = kn_type.offset('rb')
+        for (i, row) in enumerate(rows[1:]):
+            if row[0] - rows[i][0] < kn_type.size:
+                raise ValueError('Overlapping kernfs nodes: %x %x' %
+                                 (rows[i][0], row[0]))
+        for row in rows:
+            image.reserve(row[0], kn_type.size)
+
+        children = {}
+        for (addr, parent, flags, hash, ns, name, target) in rows:
+            image.new('struct kernfs_node', addr=addr, parent=parent,
+                      flags=flags, hash=hash, ns=ns,
+                      name=image.new_string(name))
+            if target is not None:
+                image.store(addr, 'struct kernfs_node', 'symlink',
+                            {'target_kn': target})
+            if parent:
+                children.setdefault(parent, []).append((hash, ns, name,
+                                                        addr + rb_offset))
+        for (parent, rbs) in children.items():
+            rbs.sort()
+            rb = fakedump.gen_rb_tree(image, [r[3] for r in rbs])
+            image.store(parent, 'struct kernfs_node', 'dir.children.rb_node',
+                        rb)
+            image.store(parent, 'struct kernfs_node', 'dir.subdirs',
+                        len(rbs))
+
+        if 'sysfs_root_kn' in self.meta:
+            image.add_symbol('sysfs_root_kn', 'struct kernfs_node *',
+                             value=int(self.meta['sysfs_root_kn']))
+        self.image = image
+
+    def sysfs_root(self):
+        '''
+        Return the saved sysfs root node as a KernfsNode (without installing
+        the snapshot)
+        '''
+        return self._kernfs_node(int(self.meta['sysfs_root_kn']))
+
+    def _kernfs_node(self, addr):
+        row = self.db.execute(self._kernfs_select + ' WHERE addr = ?',
+                              (_s64(addr),)).fetchone()
+        return KernfsNode(self, row) if row else None
+
+    def sysfs_find(self, pattern, regex=False):
+        '''
+        Find saved sysfs nodes matching a path pattern and yield (path,
+        KernfsNode) tuples, like sysfs.find() but without installing the
+        snapshot
+        '''
+        if pattern == '/sys' or pattern.startswith('/sys/'):
+            pattern = pattern[4:]
+        for path, match in kernfsfind.find(self.sysfs_root(), pattern,
+                                           regex=regex):
+            yield '/sys' + path, match
+
+    def refcnt_table(self):
+        '''
+        Return the saved net device reference counts as a list of
+        netdevice.DeviceRefcnt tuples
+        '''
+        from pykdumplib import netdevice
+
+        pcpu = {}
+        for (addr, cpu, refcnt) in self.db.execute('SELECT * FROM '
+                                                   'netdev_pcpu'):
+            pcpu.setdefault(_u64(addr), {})[cpu] = refcnt
+        # Version 1 snapshots don't have the namespace inode numbers
+        netns = 'NULL' if self.meta['version'] == '1' else 'netns'
+        return [netdevice.DeviceRefcnt(_u64(addr), _u64(net), netns, ifindex,
+                                       name, refcnt, pcpu.get(_u64(addr), {}))
+                for (addr, net, netns, ifindex, name, refcnt)
+                in self.db.execute('SELECT addr, net, %s, ifindex, name, '
+                                   'refcnt FROM netdev ORDER BY rowid' %
+                                   netns)]
+
+    def ptdump_records(self):
+        '''
+        Return the saved page table ranges as (start, end, prot, level,
+        marker) records (see dump_pagetables_c.pg_state)
+        '''
+        from pykdumplib import utils
+
+        if 'machine' not in self.meta:
+            return []
+        dump_pagetables_c = utils.arch_import('dump_pagetables_c',
+                                              arch=self.meta['machine'])
+        bad = _page_bad(dump_pagetables_c)
+        return [(_u64(start), _u64(end),
+                 bad if prot is None and marker is None else prot, level,
+                 marker)
+                for (seq, start, end, prot, level, marker)
+                in self.db.execute('SELECT * FROM ptdump ORDER BY seq')]
+
+    def ptdump_show(self):
+        '''
+        Print the saved page table ranges like ptdump_show()
+        '''
+        from pykdumplib import utils
+
+        records = self.ptdump_records()
+        if records:
+            dump_pagetables_c = utils.arch_import('dump_pagetables_c',
+                                                  arch=self.meta['machine'])
+            dump_pagetables_c.print_records(records)
+
+
+class KernfsNode(object):
+    '''
+    Kernfs node of a snapshot, with the children and link target looked up
+    in the database on demand. signature is the kernfsdiff signature of the
+    subtree (or None for older snapshots).
+    '''
+    def __init__(self, snap, row):
+        (addr, parent, flags, hash, ns, name, target, sig) = row
+        self.snap = snap
+        self.signature = sig
+        self.name = name
+        self.type = flags & kernfsfind.KERNFS_TYPE_MASK
+        self._addr = _u64(addr)
+        self._parent = _u64(parent)
+        self._target = _u64(target)
+
+    def addr(self):
+        return self._addr
+
+    def parent(self):
+        return self.snap._kernfs_node(self._parent) if self._parent else None
+
+    def fullpath(self, limit=100):
+        '''
+        Return the full path going all the way up to the root node, like
+        kernfs.Node.fullpath() (or None if there's a loop)
+        '''
+        chain = []
+        path = None
+        node = self
+        while node:
+            path = self.snap._paths.get(node._addr)
+            if path is not None:
+                break
+            if len(chain) == limit:
+                return None
+            chain.append(node)
+            node = node.parent()
+
+        for node in reversed(chain):
+            path = node.name if path is None else path + '/' + node.name
+            self.snap._paths[node._addr] = path
+        return path
+
+    def child(self, name):
+        '''
+        Return the child node with the given name (or None)
+        '''
+        if self.type != kernfsfind.KERNFS_DIR:
+            return None
+        row = self.snap.db.execute(self.snap._kernfs_select +
+                                   ' WHERE parent = ? AND name = ?',
+                                   (_s64(self._addr), name)).fetchone()
+        return KernfsNode(self.snap, row) if row else None
+
+    def iterchildren(self):
+        '''
+        Iterate through all children (in kernfs order)
+        '''
+        if self.type != kernfsfind.KERNFS_DIR:
+            return
+        rows = self.snap.db.execute(self.snap._kernfs_select +
+                                    ' WHERE parent = ?',
+                                    (_s64(self._addr),)).fetchall()
+        rows.sort(key=lambda r: (r[3], _u64(r[4]), r[5]))
+        for row in rows:
+            yield KernfsNode(self.snap, row)
+
+    def target(self):
+        '''
+        Return the target node of a link (or the node itself)
+        '''
+        if self.type != kernfsfind.KERNFS_LINK:
+            return self
+        return self.snap._kernfs_node(self._target)
+
+    def print_path(self, path):
+        '''
+        Print a node with the given path, like kernfs.Node.print_path()
+        '''
+        from pykdumplib import utils
+
+        ctype = {kernfsfind.KERNFS_DIR: 'dir',
+                 kernfsfind.KERNFS_LINK: 'link'}.get(self.type)
+        utils.cprint(path, end='', type=ctype)
+        utils.cprint(' (%x)' % self._addr)
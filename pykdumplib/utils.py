@@ -18,11 +18,10 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA.
 
+import atexit
 import importlib
-import inspect
-import os
 import platform
-import re
+import sys
 
 from pykdump.API import Addr, readSU
 from pykdump.wrapcrash import StructResult
@@ -46,44 +45,127 @@ _font_attr = {
 _font_attr_type = {
     'link': ('cyan', 'bold'),
     'dir': ('blue', 'bold'),
+    'add': ('green',),
+    'remove': ('red',),
 }
 
-def cprint(*args, **kwargs):
+class Output(object):
     '''
-    Color print
+    Buffered output backend. Text is collected and written to stdout in
+    large chunks. If color is None, ANSI color codes are only emitted if
+    stdout is a TTY (checked when the backend is created, which is done for
+    every subcommand).
     '''
-    ctype = kwargs.pop('type')
-    if ctype is not None:
-        for t in _font_attr_type[ctype]:
-            print(_font_attr[t], end='')
+    def __init__(self, color=None, bufsize=64 * 1024):
+        if color is None:
+            color = sys.stdout.isatty()
+        self.color = color
+        self.bufsize = bufsize
+        self._buf = []
+        self._len = 0
 
-    print(*args, **kwargs)
+    def use_color(self):
+        return self.color
 
-    if ctype is not None:
-        print(_font_attr['off'], end='')
+    def write(self, text):
+        self._buf.append(text)
+        self._len += len(text)
+        if self._len >= self.bufsize:
+            self.flush()
+
+    def flush(self):
+        if self._buf:
+            sys.stdout.write(''.join(self._buf))
+            self._buf = []
+            self._len = 0
+        sys.stdout.flush()
+
+_output = Output()
+atexit.register(lambda: _output.flush())
+
+def set_output(color=None, bufsize=64 * 1024):
+    '''
+    Flush and replace the output backend
+    '''
+    global _output
+    _output.flush()
+    _output = Output(color=color, bufsize=bufsize)
+
+def flush():
+    '''
+    Flush the output backend
+    '''
+    _output.flush()
+
+def cprint(*args, type=None, sep=' ', end='\n'):
+    '''
+    Color print (buffered)
+    '''
+    text = sep.join(str(a) for a in args)
+    if type is not None and _output.use_color():
+        text = (''.join(_font_attr[t] for t in _font_attr_type[type]) +
+                text + _font_attr['off'])
+    _output.write(text + end)
+
+_caches = []
+
+def register_cache(cache):
+    '''
+    Register a cache (anything with a clear() method) so that it's cleared
+    by clear_caches()
+    '''
+    _caches.append(cache)
+    return cache
+
+def clear_caches():
+    '''
+    Clear all registered caches
+    '''
+    for cache in _caches:
+        cache.clear()
 
 def singleton(cls):
     '''
-    Singleton class decorator
+    Singleton class decorator. The instances are cached by address and
+    created with the address of the struct. The StructResult (self.struct)
+    is only read on first access, unless the instance was created from one.
     '''
-    cache = {}
+    cache = register_cache({})
+
+    def struct(self):
+        return readSU(cls.struct_type, self._addr)
+    cls.struct = lazy(struct)
 
     def _getinstance(obj):
         if obj is None or obj == 0:
             return None
 
-        if isinstance(obj, StructResult):
-            struct = obj
-            addr = Addr(obj)
-        else:
-            struct = readSU(cls.struct_type, obj)
-            addr = obj
-        if addr not in cache:
-            cache[addr] = cls(struct)
-        return cache[addr]
+        # Pointers (tPtr) do pointer arithmetic, so use a plain int
+        addr = Addr(obj) if isinstance(obj, StructResult) else int(obj)
+        instance = cache.get(addr)
+        if instance is None:
+            instance = cache[addr] = cls(addr)
+            if isinstance(obj, StructResult):
+                instance.struct = obj
+        return instance
 
     return _getinstance
 
+class lazy(object):
+    '''
+    Lazy attribute decorator. The method is called on first access of the
+    attribute and the result replaces it in the instance dict.
+    '''
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.func.__name__] = self.func(instance)
+        return value
+
 def dec(name, *args, **kwargs):
     '''
     Decorator for subcommand arguments and help text
@@ -120,47 +202,78 @@ def add_subcommand_parsers(parser, module):
                                        description=cmd_desc, add_help=False)
 
         parser.add_argument('-h', '--help', action='help')
+        parser.add_argument('--profile', action='store_true',
+                            help='Profile the calls into pykdump.API and '
+                            'print a summary')
+        parser.add_argument('--profile-dump', metavar='FILE', default=None,
+                            help='Profile the calls into pykdump.API and '
+                            'dump the stats in JSON format to FILE')
         for (args, kwargs) in cmd_args:
             parser.add_argument(*args, **kwargs)
 
-        parser.set_defaults(func=cmd_cb)
+        parser.set_defaults(func=_subcommand(cmd_cb, module))
 
-def arch_import(module):
+def _subcommand(func, module):
     '''
-    Import and return an architecture specific module
+    Wrap a subcommand so that it's optionally profiled and buffered output is
+    flushed when it returns. The output backend is recreated for each call,
+    since stdout can be redirected differently for every command in a crash
+    session.
     '''
-    return importlib.import_module("pykdumplib.linux.arch." +
-                                   platform.machine() + "." + module)
+    def _wrapper(args):
+        set_output(bufsize=_output.bufsize)
+        profiler = None
+        if args.profile or args.profile_dump:
+            from pykdumplib import instrument
+            profiler = instrument.Profiler(modules=[module])
+            profiler.enable()
+        try:
+            return func(args)
+        finally:
+            flush()
+            if profiler is not None:
+                profiler.disable()
+                if args.profile:
+                    profiler.print_stats()
+                if args.profile_dump:
+                    profiler.dump_stats(args.profile_dump)
+    return _wrapper
+
+_arch_modules = {}
 
-def include(filename):
+def machine():
     '''
-    Include a file, relative to the caller's path
+    Return the architecture (machine) name used for arch specific modules
     '''
-    # The caller, its filename and its globals
-    caller = inspect.stack()[1]
-    caller_filename = caller.filename
-    caller_globals = caller.frame.f_globals
+    return platform.machine()
 
-    # The full path of the file to include
-    include = os.path.join(os.path.dirname(caller_filename), filename + ".py")
-
-    # Execute the provided filename, ensure all its declarations are added to
-    # the caller's namespace
-    exec(open(include).read(), caller_globals)
+def arch_import(module, arch=None):
+    '''
+    Import and return an architecture specific module. The modules are
+    resolved only once per architecture.
+    '''
+    if arch is None:
+        arch = machine()
+    key = (arch, module)
+    if key not in _arch_modules:
+        _arch_modules[key] = importlib.import_module(
+            "pykdumplib.linux.arch." + arch + "." + module)
+    return _arch_modules[key]
 
 def get__all__(module):
     '''
-    Parse the given module (file) and return a list of declared variables
-    and functions
+    Return a list of the variables and functions declared by the given module
+    (including those starting with an underscore), for use as its __all__.
+    Modules and functions imported from other modules are skipped.
     '''
     result = []
-    with open(module.__file__) as fh:
-        for line in fh:
-            # Variable declarations
-            m = re.match('^([a-z0-9_]+)\s*=', line, flags=re.IGNORECASE)
-            if not m:
-                # Function declarations
-                m = re.match('^def\s+([a-z0-9_]+)', line, flags=re.IGNORECASE)
-            if m:
-                result.append(m.group(1))
+    for (name, value) in vars(module).items():
+        if name.startswith('__'):
+            continue
+        if isinstance(value, type(module)):
+            continue
+        owner = getattr(value, '__module__', None)
+        if owner is not None and owner != module.__name__:
+            continue
+        result.append(name)
     return result